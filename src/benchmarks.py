@@ -0,0 +1,341 @@
+"""
+    Benchmarks for the performance-sensitive parts of the program
+
+    Run from the src directory, e.g.
+        python benchmarks.py http_pool
+        python benchmarks.py everynoise_parse saved_page.html
+        python benchmarks.py players clip.mp3
+    or with no arguments to run all of them
+"""
+
+# Local
+from everynoise import CHUNK_SIZE, NewReleases, stream_tracks
+from players import PLAYERS, create_player
+from prefetch import Prefetcher
+from spotapi import create_session
+from track import Track
+
+# Other
+from bs4 import BeautifulSoup
+from contextlib import contextmanager
+from dataclasses import dataclass
+import glob
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import mmap
+import os
+import requests
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+
+"""
+** Helpers
+"""
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """ Answers every GET with a small JSON body, gzipped if the client accepts it """
+
+    # Needed for keep-alive
+    protocol_version = 'HTTP/1.1'
+
+    # Headers and body are written separately, so Nagle would stall every reused connection
+    disable_nagle_algorithm = True
+
+    BODY = json.dumps({'items': [{'id': str(i), 'name': f"Track {i}"} for i in range(50)]}).encode()
+
+    def do_GET(self):
+        body = self.BODY
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            body = gzip.compress(body)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        # Keep the benchmark output clean
+        pass
+
+
+@contextmanager
+def stub_server(handler=_StubHandler):
+    """ Run a local HTTP server in a thread, yielding its base URL """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _time_calls(func, n: int) -> list:
+    """ Call func n times, returning the time of each call in ms """
+    timings = list()
+    for _ in range(n):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _report(label: str, timings: list) -> None:
+    print(f"{label:>24}: mean {statistics.mean(timings):7.3f} ms | median {statistics.median(timings):7.3f} ms")
+
+
+def _peak_rss() -> float | None:
+    """ Peak resident memory of this process so far, in MB, or None where it can't be read (e.g. Windows) """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # ru_maxrss is in bytes on macOS, KB elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** (2 if sys.platform == 'darwin' else 1)
+
+
+def _soup_tracks(html: bytes) -> list:
+    """ The tracks of a new releases page, through a BeautifulSoup tree and NewReleases._get_track """
+    soup = BeautifulSoup(html, 'lxml')
+    rows = [i.find_parent('tr') for i in soup.find_all('input', attrs={'name': 't'})]
+    return [NewReleases._get_track(i) for i in rows]
+
+
+def _stream_tracks(html: bytes) -> list:
+    """ The tracks of a new releases page, through stream_tracks, fed CHUNK_SIZE at a time """
+    chunks = (html[i:i+CHUNK_SIZE] for i in range(0, len(html), CHUNK_SIZE))
+    return [track for track, _ in stream_tracks(chunks)]
+
+
+# {label: function} of the ways of parsing a new releases page
+PARSERS = {'BeautifulSoup': _soup_tracks, 'stream_tracks': _stream_tracks}
+
+
+def _parse_page(parser: str, html_path: str) -> None:
+    """ 
+    Run in a fresh process by _measure_parse: parse a page, 
+    printing [number of tracks, seconds taken, growth of the resident memory to its peak in MB] as JSON
+    """
+    with open(html_path, 'rb') as f:
+        html = f.read()
+
+    # The peak is compared to the memory in use now (where it can be read), not the peak so far,
+    # which the imports may have pushed above what the parse then needs
+    before = _tree_rss(os.getpid()) or _peak_rss()
+    start = time.perf_counter()
+    tracks = PARSERS[parser](html)
+    elapsed = time.perf_counter() - start
+    after = _peak_rss()
+
+    print(json.dumps([len(tracks), elapsed, after - before if before is not None else None]))
+
+
+def _measure_parse(parser: str, html_path: str) -> list:
+    """
+    Parse a page in a fresh Python process, returning [tracks, seconds taken, peak memory growth in MB (or None)]
+
+    Memory is resident memory (RSS), as tracemalloc can't see libxml2's allocations in C
+    A fresh process per parse keeps one parse's peak from hiding the next's
+    """
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '_parse_page', parser, html_path],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def everynoise_page(n_rows: int, n_similar: int) -> bytes:
+    """ A new releases page in everynoise's list style with n_rows tracks, the last n_similar from similar genres """
+
+    def row(i: int) -> str:
+        return (
+            f'<tr><td><input type=checkbox name=t value="spotify:track:{i:022d}"></td>'
+            f'<td><span class="play trackcount" trackid="spotify:track:{i:022d}" '
+            f'preview_url="https://p.scdn.co/mp3-preview/{i:040x}">&#9654;</span></td>'
+            f'<td><a href="spotify:artist:{i % 997:022d}">Artist {i % 997}</a></td>'
+            f'<td><a href="spotify:album:{i:022d}" title="a track">Track {i}</a></td>'
+            f'<td class=note>{i % 30} days ago</td></tr>\n'
+        )
+
+    rows = [row(i) for i in range(n_rows - n_similar)]
+    rows.append('<tr class="similargenres"><td colspan=5>similar genres</td></tr>\n')
+    rows += [row(i) for i in range(n_rows - n_similar, n_rows)]
+    return f"<html><body><table>{''.join(rows)}</table></body></html>".encode()
+
+
+"""
+** Benchmarks
+"""
+
+def bench_http_pool(n: int = 300) -> None:
+    """ Per-request latency of a new connection per request vs the pooled keep-alive session """
+    with stub_server() as url:
+        session = create_session(pool_size=1)
+
+        _report('requests.get', _time_calls(lambda: requests.get(url).json(), n))
+        _report('pooled session', _time_calls(lambda: session.get(url).json(), n))
+
+        session.close()
+
+
+def bench_everynoise_parse(*fixture_paths: str) -> None:
+    """ 
+    Time and peak memory of extracting the tracks of a new releases page:
+        BeautifulSoup tree + NewReleases._get_track vs stream_tracks
+    Each is run in its own process, and memory is measured as resident memory (see _measure_parse)
+    Uses the saved pages given, or a generated 10,000 track page
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if fixture_paths:
+            pages = {os.path.basename(i): os.path.abspath(i) for i in fixture_paths}
+        else:
+            # Written to a file, for the processes the pages are parsed in
+            pages = {'generated (10,000 rows)': os.path.join(temp_dir, 'generated.html')}
+            with open(pages['generated (10,000 rows)'], 'wb') as f:
+                f.write(everynoise_page(10_000, 2_000))
+
+        for name, html_path in pages.items():
+            print(f"{name}: {os.path.getsize(html_path) / 1024 ** 2:.1f} MB")
+            for parser in PARSERS:
+                n_tracks, elapsed, peak = _measure_parse(parser, html_path)
+                peak_str = f"{peak:7.1f} MB" if peak is not None else "      ? MB"
+                print(f"{parser:>24}: {n_tracks} tracks | {elapsed:6.3f} s | peak RSS growth {peak_str}")
+
+
+@dataclass
+class _DictTrack():
+    """ Track as it was before it was slotted: a plain dataclass with a list of artists """
+    id_: str
+    name: str
+    artists: list
+    preview_url: str
+
+
+def bench_track_memory(n: int = 100_000, n_artists: int = 2_000) -> None:
+    """ Bytes per track of a queue of n tracks by n_artists artists, before and after slotting Track """
+
+    def make(track_class) -> list:
+        # Strings are built per track, as they would be when parsed from a response
+        return [
+            track_class(
+                f"{i:022d}", 
+                f"Track {i}", 
+                [(f"{i % n_artists:022d}", f"Artist {i % n_artists}")], 
+                f"https://p.scdn.co/mp3-preview/{i:040x}"
+            )
+            for i in range(n)
+        ]
+
+    for label, track_class in (('dataclass', _DictTrack), ('slotted Track', Track)):
+        tracemalloc.start()
+        tracks = make(track_class)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{label:>24}: {size / n:6.0f} bytes per track")
+        del tracks
+
+
+def _tree_rss(pid: int) -> float | None:
+    """ Resident memory, in MB, of a process and all its descendants (Linux only, else None) """
+    # {parent pid: [child pids]}, the parent being the 4th field, after the (name)
+    children = dict()
+    for stat_path in glob.glob('/proc/[0-9]*/stat'):
+        try:
+            child, rest = open(stat_path).read().split(' ', 1)
+        except OSError:
+            # The process has already exited
+            continue
+        parent = int(rest.rsplit(')', 1)[1].split()[1])
+        children.setdefault(parent, list()).append(int(child))
+    if not children:
+        return None
+
+    rss_pages, pids = 0, [pid]
+    while pids:
+        pid = pids.pop()
+        pids += children.get(pid, [])
+        try:
+            rss_pages += int(open(f'/proc/{pid}/statm').read().split()[1])
+        except OSError:
+            # The process has already exited
+            continue
+    return rss_pages * mmap.PAGESIZE / 1024 ** 2
+
+
+def bench_players(clip_path: str | None = None, listen_time: float = 2) -> None:
+    """
+    Startup time and resident memory of each player backend
+    Memory is that of the player's own processes (if any) after playing a clip for :listen_time: s,
+        and the peak of this process, which is where the null player runs (Unix only)
+    Plays the clip given, or one from the previews cache
+    """
+    if clip_path is None:
+        clip_path = next(iter(glob.glob(os.path.join(Prefetcher.DIR_CACHE, '*.mp3'))), None)
+    if clip_path is None:
+        print("No clip to play: give one, or run a queue first to fill the previews cache")
+        return
+
+    for name in PLAYERS:
+        player = create_player(name)
+        try:
+            start = time.perf_counter()
+            player.start()
+            player.play(clip_path)
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            print(f"{name:>24}: unavailable ({str(e).strip()})")
+            player.close()
+            continue
+
+        time.sleep(float(listen_time))
+        rss = _tree_rss(player.pid) if player.pid is not None else 0
+        player.close()
+
+        rss_str = f"{rss:7.1f} MB" if rss is not None else "      ? MB"
+        line = f"{name:>24}: startup {elapsed:6.3f} s | player processes {rss_str}"
+
+        if (peak := _peak_rss()) is not None:
+            line += f" | this process peak {peak:6.1f} MB"
+        print(line)
+
+
+BENCHMARKS = {
+    'http_pool': bench_http_pool,
+    'everynoise_parse': bench_everynoise_parse,
+    'track_memory': bench_track_memory,
+    'players': bench_players,
+}
+
+
+def main(args: list) -> None:
+    """ Run the named benchmark with any further args (e.g. fixture paths), or all of them """
+    if args:
+        name, *bench_args = args
+        print(f"\n== {name} ==")
+        BENCHMARKS[name](*bench_args)
+        return
+
+    for name, bench in BENCHMARKS.items():
+        print(f"\n== {name} ==")
+        bench()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['_parse_page']:
+        _parse_page(*sys.argv[2:])
+    else:
+        main(sys.argv[1:])
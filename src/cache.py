@@ -0,0 +1,203 @@
+"""
+    Size-bounded on-disk cache
+        Each entry is pickled to its own file in the cache directory
+        (or, in a FileCache, written to it as is)
+"""
+
+# Other
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+
+class DiskCache():
+    """
+    On-disk cache of picklable values, each with its own time to live
+
+    When the cache grows beyond :max_bytes:, the least recently used entries are evicted
+    Hits, misses and evictions are counted in self.stats
+    """
+
+    EXTENSION = 'pkl'
+
+    # Once full, entries are evicted until the cache is down to this fraction of max_bytes
+    # so that eviction doesn't run again on every following set
+    EVICT_TO = 0.9
+
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        > Parameters <
+        --------------
+        :directory:
+            the directory the entries are saved in (created if it doesn't exist)
+        :max_bytes:
+            the maximum total size of the entries
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+        os.makedirs(directory, exist_ok=True)
+
+        # {file_path: [size, last_used]} of every entry
+        self._entries = dict()
+        for entry in os.scandir(directory):
+            if entry.name.endswith(f".{self.EXTENSION}"):
+                stat = entry.stat()
+                self._entries[entry.path] = [stat.st_size, stat.st_mtime]
+        self._size = sum(i[0] for i in self._entries.values())
+
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _file_path(self, key) -> str:
+        """ The file path of the entry for a key (any value with a stable repr) """
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.{self.EXTENSION}")
+
+    def get(self, key, default=None):
+        """ Returns the value cached for the key, or default if it's missing or expired """
+        file_path = self._file_path(key)
+
+        try:
+            with open(file_path, 'rb') as pf:
+                expires_at, value = pickle.load(pf)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            expires_at = None
+
+        with self._lock:
+            if expires_at is None or expires_at < time.time():
+                self.stats['misses'] += 1
+                if expires_at is not None:
+                    self._remove(file_path)
+                return default
+
+            if not self._touch(file_path):
+                self.stats['misses'] += 1
+                return default
+
+            self.stats['hits'] += 1
+
+        return value
+
+    def set(self, key, value, ttl: float) -> None:
+        """ Cache a value for the key, for :ttl: seconds """
+        file_path = self._file_path(key)
+        data = pickle.dumps((time.time() + ttl, value))
+
+        # Write to a temporary file first, so readers never see a partial entry
+        temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as pf:
+            pf.write(data)
+        os.replace(temp_path, file_path)
+
+        with self._lock:
+            if file_path in self._entries:
+                self._size -= self._entries[file_path][0]
+            self._entries[file_path] = [len(data), time.time()]
+            self._size += len(data)
+
+            self._evict()
+
+    def _evict(self) -> None:
+        """ Remove the least recently used entries if the cache has outgrown max_bytes """
+        if self._size <= self.max_bytes:
+            return
+
+        target = self.max_bytes * self.EVICT_TO
+        for file_path, _ in sorted(self._entries.items(), key=lambda i: i[1][1]):
+            if self._size <= target:
+                break
+            self._remove(file_path)
+            self.stats['evictions'] += 1
+
+    def _touch(self, file_path: str) -> bool:
+        """
+        Mark an entry as recently used
+        Returns False if its file has gone since it was found (e.g. evicted by another process)
+        """
+        now = time.time()
+        try:
+            os.utime(file_path, (now, now))
+        except FileNotFoundError:
+            self._remove(file_path)
+            return False
+
+        if file_path in self._entries:
+            self._entries[file_path][1] = now
+        return True
+
+    def _remove(self, file_path: str) -> None:
+        """ Delete an entry's file and forget it """
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+        if file_path in self._entries:
+            self._size -= self._entries.pop(file_path)[0]
+
+
+class FileCache(DiskCache):
+    """
+    On-disk cache of raw bytes, each entry stored as a plain file
+        so it can be opened directly (e.g. audio by a player), rather than pickled
+    
+    Entries don't expire, they're only evicted when the cache is full (least recently used first)
+    """
+
+    def __init__(self, directory: str, max_bytes: int, extension: str):
+        """
+        > Parameters <
+        --------------
+        :directory:
+            the directory the entries are saved in (created if it doesn't exist)
+        :max_bytes:
+            the maximum total size of the entries
+        :extension:
+            the extension of the entry files, e.g. 'mp3'
+        """
+        self.EXTENSION = extension
+        super().__init__(directory, max_bytes)
+
+    def get(self, key, default=None):
+        """ Returns the file path of the entry for the key, or default if it's missing """
+        file_path = self._file_path(key)
+
+        with self._lock:
+            if not os.path.exists(file_path):
+                self.stats['misses'] += 1
+                return default
+
+            if not self._touch(file_path):
+                self.stats['misses'] += 1
+                return default
+
+            self.stats['hits'] += 1
+
+        return file_path
+
+    def set(self, key, value: bytes, ttl: float | None = None) -> str:
+        """ Cache bytes for the key, returning the file path of the entry (ttl is ignored) """
+        file_path = self._file_path(key)
+
+        # Write to a temporary file first, so readers never see a partial entry
+        temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(value)
+        os.replace(temp_path, file_path)
+
+        with self._lock:
+            if file_path in self._entries:
+                self._size -= self._entries[file_path][0]
+            self._entries[file_path] = [len(value), time.time()]
+            self._size += len(value)
+
+            self._evict()
+
+        return file_path
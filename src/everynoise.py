@@ -3,20 +3,291 @@
 """
 
 # Local
+from cache import DiskCache
+from spotapi import RateLimiter
 from track import Track
 
 # Other
 from bs4 import BeautifulSoup
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+import heapq
+import itertools
+from lxml import etree
 import os
 import pickle
 import requests
+import threading
+import time
 from tqdm import tqdm
-from typing import List
+from typing import Iterable, Iterator, List, Sequence
 import util
 
 
 URL_MAIN = 'https://everynoise.com/new_releases_by_genre.cgi?'
 
+# Bytes read from the response at a time when streaming a page
+CHUNK_SIZE = 64 * 1024
+
+# Encoding of pages that don't give one (everynoise.com's pages are UTF-8)
+DEFAULT_ENCODING = 'utf-8'
+
+
+def stream_tracks(chunks: Iterable[bytes], encoding: str = DEFAULT_ENCODING) -> Iterator[tuple[Track, bool]]:
+    """
+    Parse a new releases page incrementally, without building a tree of the whole page
+
+    Yields (Track, is_similar) for each track row as soon as it has been parsed
+        is_similar is True for rows after the similargenres row, 
+        i.e. tracks from similar genres rather than the genre searched for
+    
+    Each row is discarded once it's been read, so memory is released as parsing proceeds
+
+    > Parameters <
+    --------------
+    :chunks:
+        the page's HTML, in chunks (e.g. response.iter_content())
+    :encoding:
+        the encoding of the page (see PageCache.get)
+        Without one, libxml2 assumes Latin-1 unless the page has a <meta charset>
+    """
+    parser = etree.HTMLPullParser(events=('end',), tag='tr', encoding=encoding)
+    is_similar = False
+
+    def read_rows() -> Iterator[tuple[Track, bool]]:
+        nonlocal is_similar
+        for _, tr in parser.read_events():
+            if 'similargenres' in tr.get('class', '').split():
+                is_similar = True
+            elif (track := _get_track_from_element(tr)) is not None:
+                yield track, is_similar
+
+            # Release the row, and anything before it, now that it's been read
+            tr.clear(keep_tail=True)
+            while tr.getprevious() is not None:
+                del tr.getparent()[0]
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from read_rows()
+
+    parser.close()
+    yield from read_rows()
+
+
+def _get_track_from_element(tr) -> Track | None:
+    """ 
+    Given a parsed track row (lxml element), return a Track object
+    Equivalent to NewReleases._get_track, returns None if the row isn't a track row
+    """
+    if tr.find(".//input[@name='t']") is None:
+        return None
+
+    play = next(iter(tr.xpath(".//span[contains(concat(' ', @class, ' '), ' play ')]")), None)
+    links = tr.findall('.//a')
+    artist = next((i for i in links if 'artist' in i.get('href', '')), None)
+    if play is None or artist is None or len(links) < 2:
+        return None
+
+    return Track(
+        id_ = play.get('trackid').replace("spotify:track:", ""),
+        name = ''.join(links[1].itertext()),
+        preview_url = play.get('preview_url'),
+        artists = [(artist.get('href').replace("spotify:artist:", ""), ''.join(artist.itertext()))]
+    )
+
+
+class PageCache():
+    """
+    On-disk HTTP cache for everynoise.com pages, keyed by the request params
+
+    A page fetched less than :fresh_for: seconds ago is served without a request
+    Once stale, it's revalidated with its ETag / Last-Modified, 
+        so an unchanged page costs a 304 rather than a download
+    """
+
+    DIR_CACHE = '../data/cache/everynoise'
+    MAX_BYTES = 100 * 1024 ** 2
+
+    # How long pages are kept for revalidation
+    TTL_STORE = 30 * 24 * 60 * 60 # seconds
+
+    # Cache shared by the rest of the program, see PageCache.shared()
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, directory: str = DIR_CACHE, max_bytes: int = MAX_BYTES) -> None:
+        self.cache = DiskCache(directory, max_bytes)
+
+    @classmethod
+    def shared(cls):
+        """
+        ** Alternative Constructor **
+        Return the instance shared across the program, creating it on first use
+        """
+        # Locked, as the crawler's workers first ask for it all at once
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @staticmethod
+    def _chunks(body: bytes) -> Iterator[bytes]:
+        """ 
+        Yield a cached page in CHUNK_SIZE slices, as it would be streamed
+        Fed to the parser all at once, it would build the whole tree before any row is cleared
+        """
+        for i in range(0, len(body), CHUNK_SIZE):
+            yield body[i:i+CHUNK_SIZE]
+
+    @staticmethod
+    def _encoding(response: requests.Response) -> str:
+        """ 
+        The charset of the response's Content-Type, or DEFAULT_ENCODING
+        (not response.encoding, which is ISO-8859-1 for any text/html without a charset)
+        """
+        message = Message()
+        message['Content-Type'] = response.headers.get('Content-Type', '')
+        return message.get_content_charset() or DEFAULT_ENCODING
+
+    def get(self, params: dict, fresh_for: float) -> tuple[str, Iterator[bytes]]:
+        """
+        Returns the encoding of the page for the given params, and the page in chunks
+            from the cache if it's fresh or unchanged, otherwise streamed from everynoise.com
+
+        The request, if one is needed, is made straight away, so errors are raised from here
+        The encoding is cached with the page, so a cached page decodes as it did when fetched
+
+        > Parameters <
+        --------------
+        :params:
+            the params of the request to URL_MAIN
+        :fresh_for:
+            the number of seconds a cached page is used for without revalidating it
+        """
+        key = ('everynoise', tuple(sorted(params.items())))
+        entry = self.cache.get(key)
+
+        # Pages cached by older versions have no encoding
+        if entry and time.time() - entry['fetched_at'] < fresh_for:
+            return entry.get('encoding', DEFAULT_ENCODING), self._chunks(entry['body'])
+
+        # Conditional request, so the page is only sent if it has changed
+        headers = dict()
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        response = requests.get(URL_MAIN, params=params, headers=headers, stream=True)
+
+        if entry and response.status_code == 304:
+            response.close()
+            entry['fetched_at'] = time.time()
+            self.cache.set(key, entry, self.TTL_STORE)
+            return entry.get('encoding', DEFAULT_ENCODING), self._chunks(entry['body'])
+
+        try:
+            response.raise_for_status()
+        except requests.RequestException:
+            response.close()
+            raise
+
+        encoding = self._encoding(response)
+        return encoding, self._stream(key, response, encoding)
+
+    def _stream(self, key: tuple, response: requests.Response, encoding: str) -> Iterator[bytes]:
+        """ Stream the page on to the caller, keeping the chunks to cache it once it's all been read """
+        with response:
+            chunks = list()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                chunks.append(chunk)
+                yield chunk
+
+        self.cache.set(key, {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+            'encoding': encoding,
+            'body': b''.join(chunks),
+        }, self.TTL_STORE)
+
+
+class GenreIndex():
+    """
+    Index of everynoise.com's genres for exact, prefix and fuzzy lookups
+
+    - Exact matches are checked against a set
+    - Prefix matches are found by binary search of the sorted genres
+    - Fuzzy matches are found through a trigram index, 
+        scoring the genres that share trigrams with the text
+    """
+
+    def __init__(self, genres: List[str]) -> None:
+        self.genres = sorted(set(genres))
+        self._exact = set(self.genres)
+
+        # Lowercased genres (in the same order) for prefix matching
+        self._lower = [i.lower() for i in self.genres]
+        self._by_lower = sorted(range(len(self.genres)), key=lambda i: self._lower[i])
+        self._sorted_lower = [self._lower[i] for i in self._by_lower]
+
+        # {trigram: [index of each genre containing it]}
+        self._trigrams = dict()
+        for i, genre in enumerate(self._lower):
+            for trigram in self.trigrams(genre):
+                self._trigrams.setdefault(trigram, []).append(i)
+
+    def __contains__(self, genre: str) -> bool:
+        return genre in self._exact
+
+    def __len__(self) -> int:
+        return len(self.genres)
+
+    @staticmethod
+    def trigrams(text: str) -> set:
+        """ The set of three-character substrings of the (padded) text """
+        padded = f"  {text} "
+        return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+    def starting_with(self, prefix: str, n: int = 10) -> List[str]:
+        """ Up to n genres beginning with prefix (case-insensitive) """
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._sorted_lower, prefix)
+
+        results = list()
+        for i in range(start, min(start + n, len(self._sorted_lower))):
+            if not self._sorted_lower[i].startswith(prefix):
+                break
+            results.append(self.genres[self._by_lower[i]])
+        return results
+
+    def suggest(self, text: str, n: int = 5) -> List[str]:
+        """ 
+        Up to n genres closest to text (e.g. for a typo)
+            genres beginning with it first, then by trigram similarity
+        """
+        results = self.starting_with(text, n)
+
+        trigrams = self.trigrams(text.lower())
+        shared = dict()
+        for trigram in trigrams:
+            for i in self._trigrams.get(trigram, ()):
+                shared[i] = shared.get(i, 0) + 1
+
+        # Similarity: shared trigrams over all trigrams of either
+        def score(i: int) -> float:
+            return shared[i] / (len(trigrams) + len(self._lower[i]) + 1 - shared[i])
+
+        for i in heapq.nlargest(n, shared, key=score):
+            if len(results) >= n:
+                break
+            if self.genres[i] not in results:
+                results.append(self.genres[i])
+
+        return results
+
 
 class SearchOptions(dict):
     """
@@ -25,17 +296,23 @@ class SearchOptions(dict):
 
     FN_SEARCH_OPTIONS = '../data/everynoise_nr_searchoptions.pkl'
 
+    # How long the options page is used for before it's revalidated
+    FRESH_FOR = 24 * 60 * 60 # seconds
+
     def __init__(self):
         search_options = self._get_search_options()
         super().__init__(**search_options)
+
+        # Pickled along with the options, so it's only built when they're scraped
+        self.genre_index = GenreIndex(self['genres'])
         self.save()
 
     def _get_search_options(self) -> dict:
         """ 
         Scrape search options for everynoise.com's new releases page 
         """
-        response = requests.get(URL_MAIN)
-        soup = BeautifulSoup(response.text, 'lxml')
+        encoding, chunks = PageCache.shared().get({}, self.FRESH_FOR)
+        soup = BeautifulSoup(b''.join(chunks), 'lxml', from_encoding=encoding)
         select_tags = soup.find_all('select')
 
         # Get regions, dates, etc.
@@ -68,6 +345,11 @@ class SearchOptions(dict):
         with open(file_path, 'rb') as pf:
             search_options = pickle.load(pf)
 
+        # Options saved by older versions have no genre index
+        if not hasattr(search_options, 'genre_index'):
+            search_options.genre_index = GenreIndex(search_options['genres'])
+            search_options.save()
+
         return search_options
 
     def save(self) -> None:
@@ -81,6 +363,14 @@ class NewReleases():
     hide_dupes = 'on'
     style = 'list'
 
+    # How long a cached page is used for before it's revalidated (see PageCache)
+    # The latest week's page changes as releases are catalogued, past weeks' pages don't
+    FRESH_FOR_LATEST = 6 * 60 * 60 # seconds
+    FRESH_FOR_DATED = 7 * 24 * 60 * 60 # seconds
+
+    # Whether to show progress while reading the page
+    show_progress = True
+
     pattern_spotify_track = r"spotify:track:([A-Za-z0-9]+)"
     pattern_spotify_artist = r"spotify:artist:([A-Za-z0-9]+)"
 
@@ -89,6 +379,7 @@ class NewReleases():
         genre: str = 'anygenre',
         region: str = 'US',
         date: str | None = None, # If None, defaults to most recent week
+        search_options: SearchOptions | None = None
         ) -> None:
         """
         Initialises new_releases
@@ -101,13 +392,19 @@ class NewReleases():
             the region of the world
         :date: (str)
             format: YYYYMMDD
+        :search_options: (SearchOptions)
+            the search options to validate against
+            DEFAULT: None
+                -> loads them (see SearchOptions.load)
         """
 
-        self.search_options = SearchOptions.load()
+        self.search_options = search_options or SearchOptions.load()
 
         # Validate genre and assign to self
-        if not genre in self.search_options['genres']:
-            raise ValueError(f"Invalid genre: {genre}")
+        genre_index = self.search_options.genre_index
+        if not genre in genre_index:
+            suggestions = genre_index.suggest(genre)
+            raise ValueError(f"Invalid genre: {genre}" + (f" (did you mean: {', '.join(suggestions)}?)" if suggestions else ''))
         self.genre = genre
 
         # Validate region and assign to self
@@ -120,8 +417,9 @@ class NewReleases():
             raise ValueError(f"Invalid date: {date}")      
         self.date = date
 
-        # Get results
-        self.soup = self.get_soup()
+        # Tracks for the genre, and for similar genres, once the page has been read
+        # See self._partition()
+        self._partitioned = None
 
     def __str__(self):
         # TODO test this prints prettily
@@ -138,7 +436,8 @@ class NewReleases():
 
     def __len__(self):
         # Returns the number of tracks found
-        return len(self.tracks)
+        tracks, _ = self._partition()
+        return len(tracks)
 
     @property
     def params(self) -> dict:
@@ -160,20 +459,45 @@ class NewReleases():
         soup = BeautifulSoup(response.text, 'lxml')
         return soup
 
+    def iter_tracks(self) -> Iterator[tuple[Track, bool]]:
+        """ 
+        Stream the page, yielding (Track, is_similar) as each track row is parsed 
+        See stream_tracks
+
+        The page comes through PageCache, so repeat runs don't download it again
+        """
+        fresh_for = self.FRESH_FOR_DATED if self.date else self.FRESH_FOR_LATEST
+        encoding, chunks = PageCache.shared().get(self.params, fresh_for)
+        yield from stream_tracks(chunks, encoding)
+
+    def _partition(self) -> tuple[List[Track], List[Track]]:
+        """
+        Read the page in one pass, splitting its tracks into 
+            those for the genre specified, and those for similar genres
+        The result is memoized, so the page is only fetched and parsed once
+        """
+        if self._partitioned is None:
+            tracks, similar_tracks = list(), list()
+
+            if self.show_progress:
+                print("Getting tracks from everynoise")
+            for track, is_similar in tqdm(self.iter_tracks(), unit=' tracks', disable=not self.show_progress):
+                (similar_tracks if is_similar else tracks).append(track)
+
+            self._partitioned = (tracks, similar_tracks)
+        return self._partitioned
+
     @property
     def tracks(self) -> List[Track]:
         """ Extract the tracks for the genre specified """
-        pre_results = [i.find_parent('tr') for i in self.soup.find_all('input', attrs={'name': 't'})]
-        results = [i for i in pre_results if i.find_previous_sibling('tr', class_='similargenres') is None]
-
-        print("Getting tracks from everynoise")
-        return [self._get_track(i) for i in tqdm(results)] 
+        tracks, _ = self._partition()
+        return list(tracks)
 
     @property
     def tracks_and_similar(self) -> List[Track]:
         """ Extract the tracks for the genre specified, and similar genres """
-        results = [i.find_parent('tr') for i in self.soup.find_all('input', attrs={'name': 't'})]
-        return [self._get_track(i) for i in results]
+        tracks, similar_tracks = self._partition()
+        return tracks + similar_tracks
 
     @staticmethod
     def _get_track(tr) -> Track:
@@ -227,11 +551,98 @@ class NewReleases():
         return Track(
             id_ = track_id,
             name = track_name,
-            artists = list((artist_id, artist_name)),
+            artists = [(artist_id, artist_name)],
             preview_url = preview_url
         )
 
 
+class Crawler():
+    """
+    Fetches the new releases pages for many genres / regions / dates concurrently
+
+    At most MAX_WORKERS pages are fetched at once, 
+        and requests are started at most RATE per second, to be polite to everynoise.com
+    """
+
+    MAX_WORKERS = 6
+    RATE = 4 # requests per second
+
+    def __init__(self, max_workers: int = MAX_WORKERS, rate: float = RATE) -> None:
+        """
+        > Parameters <
+        --------------
+        :max_workers:
+            the maximum number of pages fetched at once
+        :rate:
+            the maximum number of requests started per second
+        """
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(rate, burst=1)
+
+        # Loaded once and shared by every page
+        self.search_options = SearchOptions.load()
+
+    def dates_between(self, start: str, end: str) -> List[str]:
+        """ The dates (YYYYMMDD) available on everynoise.com from start to end inclusive """
+        return sorted(i for i in self.search_options['date'] if i and start <= i <= end)
+
+    def crawl(
+        self,
+        genres: Sequence[str],
+        regions: Sequence[str] = ('US',),
+        dates: Sequence[str | None] = (None,),
+        similar: bool = False
+        ) -> List[Track]:
+        """
+        Get the tracks of every combination of genre, region and date
+            Tracks found on more than one page are only included once (the first time)
+
+        Invalid genres / regions / dates are reported and skipped, as are pages that couldn't be fetched
+
+        > Parameters <
+        --------------
+        :genres:
+            the genres to search by
+        :regions:
+            the regions to search by
+        :dates:
+            the dates (YYYYMMDD) to search by, None meaning the most recent week
+        :similar:
+            if True, include tracks from similar genres
+        """
+        new_releases = list()
+        errors = dict()
+        for genre, region, date in itertools.product(genres, regions, dates):
+            try:
+                new_releases.append(NewReleases(genre, region, date, search_options=self.search_options))
+            except ValueError as e:
+                errors[str(e)] = None
+
+        # Each invalid value would otherwise be reported once per combination
+        [print(i) for i in errors]
+
+        def fetch(nr: NewReleases) -> List[Track]:
+            # One progress bar for the crawl, rather than one per page
+            nr.show_progress = False
+            self.rate_limiter.acquire()
+            try:
+                return nr.tracks_and_similar if similar else nr.tracks
+            except requests.RequestException as e:
+                # Keep the pages crawled so far, and the rest
+                print(f"Couldn't get {nr.genre} ({nr.region}, {nr.date or 'latest'}): {e}")
+                return list()
+
+        # Merge the pages in order, dropping tracks already seen
+        tracks = dict()
+        print(f"Getting tracks from everynoise ({len(new_releases)} pages)")
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            for page_tracks in tqdm(executor.map(fetch, new_releases), total=len(new_releases), unit=' pages'):
+                for track in page_tracks:
+                    tracks.setdefault(track.id_, track)
+
+        return list(tracks.values())
+
+
 if __name__ == '__main__':
     pass
 
@@ -0,0 +1,284 @@
+"""
+    Module for filtering the tracks of a queue
+        Which tracks pass each filter is kept as a mask (see FilterMasks),
+        so the queue can be refiltered without running the filters again
+"""
+
+# Local
+from track import Track
+
+# Other
+from collections.abc import Sequence
+import itertools
+import time
+
+
+class Filter():
+    """
+    A filter of tracks, used through FilterMasks
+    Subclasses implement keep(), and may keep state between tracks (e.g. those already seen)
+        Tracks are always passed to keep() in the order they were added to the queue
+    """
+
+    # Name of the filter in reports
+    label = None
+
+    # True if whether a track passes depends on the tracks before it (e.g. unique filters)
+    stateful = False
+
+    def keep(self, track: Track) -> bool:
+        """ Returns True if the track passes the filter """
+        raise NotImplementedError
+
+
+class HasPreviewUrl(Filter):
+    """
+    Only tracks with a preview URL
+    This filter must always be used because tracks without a preview URL are not playable!
+    """
+
+    label = 'has preview'
+
+    def keep(self, track: Track) -> bool:
+        return bool(track.preview_url)
+
+
+class NewTracks(Filter):
+    """ Only tracks the user has not listened to yet using the program """
+
+    label = 'new tracks'
+
+    def __init__(self, listened_tracks: set):
+        """
+        > Parameters <
+        --------------
+        :listened_tracks:
+            the set of ids of the tracks the user has listened to (see ListeningHistory.ids)
+            It's kept, not copied, so tracks added later are checked against the latest history
+        """
+        self.listened_tracks = listened_tracks
+
+    def keep(self, track: Track) -> bool:
+        return track.id_ not in self.listened_tracks
+
+
+class NewArtists(Filter):
+    """ Only tracks with at least one artist the user has not listened to yet using the program """
+
+    label = 'new artists'
+
+    def __init__(self, listened_artists: set):
+        """
+        > Parameters <
+        --------------
+        :listened_artists:
+            the set of ids of the artists the user has listened to (see ListeningHistory.ids)
+        """
+        self.listened_artists = listened_artists
+
+    def keep(self, track: Track) -> bool:
+        return not all(i[0] in self.listened_artists for i in track.artists)
+
+
+class UniqueTracks(Filter):
+    """ Only the first of any tracks with the same id """
+
+    label = 'unique tracks'
+    stateful = True
+
+    def __init__(self):
+        self.seen = set()
+
+    def keep(self, track: Track) -> bool:
+        if track.id_ in self.seen:
+            return False
+        self.seen.add(track.id_)
+        return True
+
+
+class UniqueArtists(Filter):
+    """ Only tracks with at least one artist not in any track before it """
+
+    label = 'unique artists'
+    stateful = True
+
+    def __init__(self):
+        self.seen = set()
+
+    def keep(self, track: Track) -> bool:
+        artist_ids = [i[0] for i in track.artists]
+        if all(i in self.seen for i in artist_ids):
+            return False
+        self.seen.update(artist_ids)
+        return True
+
+
+def _and(a: bytes, b: bytes) -> bytes:
+    """ Combine two masks of the same length: 1 where both are 1 """
+    return (int.from_bytes(a, 'little') & int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+
+class FilterMasks():
+    """
+    Which tracks pass each filter, as a mask per filter: a bytearray with 1 for each track that passes
+
+    Masks are computed the first time a filter is used, then kept,
+        so switching filters on and off combines masks rather than filtering again,
+        and switching a filter off brings back the tracks it dropped
+    When tracks are added, each mask is extended by filtering only the new tracks
+        (each filter keeps its state, e.g. the ids a unique filter has seen)
+
+    Filters are applied in order, as if each track went through them one after another:
+        the base filter (HasPreviewUrl) first, then those given to select()
+    So a stateful filter (e.g. unique artists) only sees the tracks that pass the filters before it,
+        and its mask is kept per combination of those filters
+        (e.g. with new tracks on, an artist's listened track doesn't hide their new one)
+    Stateless filters see every track the base filter passes, so have one mask each
+
+    The tracks each filter drops, and the time spent filtering, are counted in self.stats (per select)
+
+    Masks are pickled with the stateful filters (e.g. the ids a unique filter has seen), so they can be saved with the queue
+        Stateless filters aren't, as they may hold large shared sets (e.g. the listening history):
+        the filter given to select() next is used instead
+    self.changed is True if masks have been extended since they were created or unpickled
+    """
+
+    # Swaps 0 and 1, to turn a mask of tracks to exclude into a mask of tracks to keep
+    INVERT = bytes.maketrans(b'\x00\x01', b'\x01\x00')
+
+    def __init__(self, base: Filter):
+        """
+        > Parameters <
+        --------------
+        :base:
+            the filter every track must pass
+        """
+        self.base = base
+
+        # {key: Filter} and {key: mask} of every filter used so far (see _key)
+        self._filters = dict()
+        self._masks = dict()
+
+        self.stats = dict()
+        self.changed = True
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_filters'] = {k: v if v.stateful else None for k, v in self._filters.items()}
+        state['stats'] = dict()
+        del state['changed']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.changed = False
+
+    @staticmethod
+    def _key(filter_: Filter, before: Sequence[Filter]) -> tuple:
+        """ The key of a filter's mask: its label, then for a stateful filter those of the filters before it """
+        if filter_.stateful:
+            return (filter_.label, *(i.label for i in before))
+        return (filter_.label,)
+
+    def mask(self, filter_: Filter, tracks: Sequence[Track], before: Sequence[Filter] = ()) -> bytearray:
+        """
+        The mask over tracks of the filter with the same label as filter_, after the filters :before: it,
+            filtering any tracks added since it was last used
+        filter_ is only used if no filter with its key has been used before (or it wasn't pickled, see above)
+        """
+        key = self._key(filter_, before)
+        if self._filters.get(key) is None:
+            self._filters[key] = filter_
+            self._masks.setdefault(key, bytearray())
+        filter_, mask = self._filters[key], self._masks[key]
+
+        stats = self.stats.setdefault(filter_.label, {'dropped': 0, 'seconds': 0.0})
+        if len(mask) >= len(tracks):
+            return mask
+
+        offset = len(mask)
+
+        # Which of the new tracks reach this filter
+        # The masks this depends on are extended first (recursively)
+        gate = None
+        if filter_ is not self.base:
+            gate = bytes(self.mask(self.base, tracks)[offset:])
+            if filter_.stateful:
+                for n, prior in enumerate(before):
+                    gate = _and(gate, self.mask(prior, tracks, before[:n])[offset:])
+
+        start = time.perf_counter()
+        keep = filter_.keep
+        if gate is None:
+            mask.extend(keep(i) for i in tracks[offset:])
+        else:
+            # A stateful filter must only see the tracks that reach it, hence the short-circuit
+            mask.extend(gate[n] and keep(i) for n, i in enumerate(tracks[offset:]))
+        stats['seconds'] += time.perf_counter() - start
+        self.changed = True
+
+        return mask
+
+    def select(self, filters: list[Filter], tracks: Sequence[Track], start: int = 0, exclude: bytes | None = None) -> list[int]:
+        """
+        Returns the indices of the tracks from :start: onwards that pass the base filter and every filter given
+        
+        > Parameters <
+        --------------
+        :filters:
+            the filters to combine, in order (any new ones are run over the tracks)
+        :tracks:
+            every track (masks are kept for all of them, whatever :start:)
+        :start:
+            the first track to select from, e.g. the first of those just added
+        :exclude:
+            a mask (over all the tracks) of tracks to leave out whatever the filters, e.g. those played
+        """
+        self.stats = dict()
+
+        combined = bytes(self.mask(self.base, tracks)[start:])
+        self.stats[self.base.label]['dropped'] = combined.count(0)
+
+        for n, filter_ in enumerate(filters):
+            passed = combined.count(1)
+            combined = _and(combined, self.mask(filter_, tracks, filters[:n])[start:])
+            self.stats[filter_.label]['dropped'] = passed - combined.count(1)
+
+        if exclude is not None:
+            combined = _and(combined, bytes(exclude[start:]).translate(self.INVERT))
+
+        return list(itertools.compress(range(start, len(tracks)), combined))
+
+    def report(self) -> str:
+        """ The tracks dropped by each filter, and the time spent filtering, in the last select """
+        return '\n'.join(
+            f"{label:>16}: dropped {stats['dropped']:6} | {stats['seconds'] * 1000:8.2f} ms"
+            for label, stats in self.stats.items()
+        )
+
+
+class TrackView(Sequence):
+    """ The tracks at the given indices of another sequence of tracks, without copying them """
+
+    def __init__(self, tracks: Sequence[Track], indices: Sequence[int]):
+        """
+        > Parameters <
+        --------------
+        :tracks:
+            the tracks
+        :indices:
+            the indices of the tracks in the view, in order
+        """
+        self.tracks = tracks
+        self.indices = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return TrackView(self.tracks, self.indices[i])
+        return self.tracks[self.indices[i]]
+
+    def __iter__(self):
+        return (self.tracks[i] for i in self.indices)
@@ -0,0 +1,163 @@
+"""
+    Module for storing the user's listening history
+        Ids are kept in an append-only log file on disk
+        and indexed in memory by a set
+    Writes are buffered and flushed to disk by a background thread
+"""
+
+# Local
+import util
+
+# Other
+import atexit
+import os
+import threading
+from typing import Iterable, Iterator
+
+
+class ListeningHistory():
+    """
+    Append-only store of ids (tracks or artists) the user has listened to
+
+    Membership checks are made against the in-memory set,
+        so they don't touch the disk at all
+    New ids are added to the set straight away and buffered,
+        then appended to the end of the log file in the background
+        once FLUSH_COUNT ids are pending or FLUSH_INTERVAL seconds have passed
+    Anything still pending is flushed at exit
+    """
+
+    # Extension of the log file
+    EXTENSION = 'log'
+
+    # Flush thresholds for the write-behind buffer
+    FLUSH_COUNT = 50
+    FLUSH_INTERVAL = 10 # seconds
+
+    # Instances already loaded this session, by file name
+    _loaded = dict()
+
+    def __init__(self, file_name: str):
+        """
+        > Parameters <
+        --------------
+        :file_name:
+            the file name of the store (without extension)
+        """
+        self.file_name = file_name
+        self._ids = set()
+
+        # Ids waiting to be written to the log file
+        self._pending = list()
+        self._condition = threading.Condition()
+
+        # Keeps flushes in order without holding up update() during the write
+        self._write_lock = threading.Lock()
+
+        # Import the old pickle format if no log exists yet
+        if not os.path.exists(self.file_path):
+            self._migrate()
+
+        self._read()
+
+        # Start the thread that writes pending ids to disk
+        # Daemon, so it never holds up exit; the atexit flush takes care of the rest
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    @classmethod
+    def load(cls, file_name: str):
+        """
+        ** Alternative Constructor **
+        Return the store for the given file, reading it from disk only once per session
+        """
+        if file_name not in cls._loaded:
+            cls._loaded[file_name] = cls(file_name)
+        return cls._loaded[file_name]
+
+    @property
+    def file_path(self) -> str:
+        return f"{self.file_name}.{self.EXTENSION}"
+
+    def __contains__(self, id_: str) -> bool:
+        """ Returns True if the id has been listened to """
+        return id_ in self._ids
+
+    def __len__(self) -> int:
+        """ Returns the number of unique ids listened to """
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._ids)
+
+    @property
+    def ids(self) -> set:
+        """ 
+        The in-memory set of ids itself, kept up to date by update() 
+        For lookups in hot loops; it must not be modified
+        """
+        return self._ids
+
+    def update(self, ids: Iterable[str]) -> None:
+        """
+        Add ids to the store
+        Only those not already in it are buffered for writing
+        """
+        with self._condition:
+            for id_ in ids:
+                if id_ and id_ not in self._ids:
+                    self._ids.add(id_)
+                    self._pending.append(id_)
+
+            # Wake the flusher early if enough ids have built up
+            if len(self._pending) >= self.FLUSH_COUNT:
+                self._condition.notify()
+
+    def flush(self) -> None:
+        """ Write any pending ids to the log file """
+        with self._write_lock:
+            with self._condition:
+                pending, self._pending = self._pending, list()
+            if pending:
+                self._append(pending)
+
+    def _flush_loop(self) -> None:
+        """ Flush pending ids whenever a threshold is reached """
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: len(self._pending) >= self.FLUSH_COUNT, 
+                    timeout=self.FLUSH_INTERVAL
+                )
+            self.flush()
+
+    """
+    ** File
+    """
+
+    def _read(self) -> None:
+        """ Build the in-memory index from the log file """
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                self._ids = {line for line in f.read().splitlines() if line}
+        except FileNotFoundError:
+            # Assume file not created yet
+            # So user has not listened to anything with the program
+            self._ids = set()
+
+    def _append(self, ids: list) -> None:
+        """ Append ids to the end of the log file """
+        with open(self.file_path, 'a', encoding='utf-8') as f:
+            f.write(''.join(f"{i}\n" for i in ids))
+
+    def _migrate(self) -> None:
+        """ Write the contents of the old pickle file (a list of ids) to the log file """
+        try:
+            legacy_ids = util.load_pkl(self.file_name)
+        except FileNotFoundError:
+            return
+
+        # dict.fromkeys removes duplicates while keeping the listening order
+        self._append([i for i in dict.fromkeys(legacy_ids) if i])
+        print(f"Migrated listening history to {self.file_path}")
@@ -0,0 +1,141 @@
+"""
+    Module for journaling a queue's progress between saves
+        Events are appended to a small file as they happen,
+        so they survive the program being killed before the queue is saved
+"""
+
+# Other
+import json
+import os
+import threading
+import time
+from typing import Callable, Iterator
+
+
+class Journal():
+    """
+    Append-only file of events, one JSON list per line: [event, *args]
+
+    Each event is written straight to the file, so it survives the process being killed
+    To survive the machine going down as well, the file is fsynced,
+        but only once FSYNC_COUNT events are unsynced or FSYNC_INTERVAL seconds have passed,
+        as fsyncing every event would be slow
+
+    Once the state the events describe has been saved elsewhere, the journal is compacted (i.e. cleared)
+    """
+
+    # Extension of the journal file
+    EXTENSION = 'journal'
+
+    # Thresholds for fsyncing
+    FSYNC_COUNT = 20
+    FSYNC_INTERVAL = 5 # seconds
+
+    def __init__(self, file_name: str):
+        """
+        > Parameters <
+        --------------
+        :file_name:
+            the file name of the journal (without extension)
+        """
+        self.file_name = file_name
+
+        self._file = None
+        self._lock = threading.Lock()
+
+        # Events written since the last fsync, and when that was
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+        # Events appended since the journal was last cleared
+        self._appended = 0
+
+    @property
+    def file_path(self) -> str:
+        return f"{self.file_name}.{self.EXTENSION}"
+
+    def append(self, *events: list) -> None:
+        """ Write events to the end of the journal, all at once """
+        data = ''.join(f"{json.dumps(i, separators=(',', ':'))}\n" for i in events)
+
+        with self._lock:
+            if self._file is None:
+                self._open()
+            self._file.write(data)
+            self._file.flush()
+
+            self._unsynced += len(events)
+            self._appended += len(events)
+            if self._unsynced >= self.FSYNC_COUNT or time.monotonic() - self._synced_at >= self.FSYNC_INTERVAL:
+                self._sync()
+
+    def replay(self) -> Iterator[list]:
+        """ Yields the events in the journal, oldest first """
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return
+
+        for line in lines:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # The program was killed part way through writing this event
+                continue
+
+    def __len__(self) -> int:
+        """ Returns the number of events appended since the journal was last cleared """
+        return self._appended
+
+    def compact(self, save: Callable[[], None]) -> None:
+        """
+        Call save, which saves the state the events describe, then clear the journal
+        No events can be appended in between, so none are lost
+        """
+        with self._lock:
+            save()
+            self._remove()
+
+    def clear(self) -> None:
+        """ Remove every event """
+        with self._lock:
+            self._remove()
+
+    def close(self) -> None:
+        """ Fsync and close the file (it's reopened by the next append) """
+        with self._lock:
+            if self._file is None:
+                return
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def _remove(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+        self._unsynced = 0
+        self._appended = 0
+
+    def _open(self) -> None:
+        # If the last event was cut short, start on a new line, so the next event isn't lost with it
+        cut_short = False
+        try:
+            with open(self.file_path, 'rb') as f:
+                if f.seek(0, os.SEEK_END) > 0:
+                    f.seek(-1, os.SEEK_END)
+                    cut_short = f.read(1) != b'\n'
+        except FileNotFoundError:
+            pass
+
+        self._file = open(self.file_path, 'a', encoding='utf-8')
+        if cut_short:
+            self._file.write('\n')
+
+    def _sync(self) -> None:
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
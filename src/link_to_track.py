@@ -1,10 +1,13 @@
 
 # Local
-from spotapi import SpotApi
+from cache import DiskCache
+from spotapi import AsyncSpotApi, SpotApi
 from track import Track, convert_to_track_object_dec
 
 # Other
+import asyncio
 import re
+import requests
 from typing import List
 
 
@@ -15,12 +18,22 @@ class LinkToTrack():
     - Album
     - Artist
     - Playlist
+
+    Blocking interface to AsyncLinkToTrack
     """
 
     PATTERN_LINK = r"(?:https://open.spotify.com/)?(artist|album|playlist)/([\w\d]+)(?:\?[\w\d=&]+)?"
 
-    def __init__(self) -> None:
-        self.spotapi = SpotApi()
+    def __init__(self, spotapi: SpotApi | None = None) -> None:
+        """
+        > Parameters <
+        --------------
+        :spotapi:
+            the SpotApi to make requests with
+            DEFAULT: None
+                -> uses the shared SpotApi
+        """
+        self.spotapi = spotapi or SpotApi.shared()
 
     @classmethod
     def get_category_and_id(cls, link) -> bool:
@@ -36,6 +49,106 @@ class LinkToTrack():
         return bool(re.findall(cls.PATTERN_LINK, link))
 
     def link(self, link:str):
+        """ See AsyncLinkToTrack.link """
+        return self.__run('link', link)
+
+    def links(self, links:List[str]) -> List[List[Track] | None]:
+        """ See AsyncLinkToTrack.links """
+        return self.__run('links', links)
+
+    def playlist(self, playlist_id:str) -> List[Track]:
+        """ See AsyncLinkToTrack.playlist """
+        return self.__run('playlist', playlist_id)
+
+    def album(self, album_id:str) -> List[Track]:
+        """ See AsyncLinkToTrack.album """
+        return self.__run('album', album_id)
+
+    def albums(self, album_ids:List[str]) -> List[Track]:
+        """ See AsyncLinkToTrack.albums """
+        return self.__run('albums', album_ids)
+
+    def artist(self, artist_id:str, release_types:list|str = 'ALL') -> List[Track]:
+        """ See AsyncLinkToTrack.artist """
+        return self.__run('artist', artist_id, release_types)
+
+    def __run(self, method_name:str, *args):
+        """ 
+        Run a method of AsyncLinkToTrack to completion in a new event loop 
+        The AsyncLinkToTrack is created inside the loop, as its concurrency limit belongs to it
+        """
+        async def run():
+            async_link_to_track = AsyncLinkToTrack(self.spotapi)
+            return await getattr(async_link_to_track, method_name)(*args)
+
+        return asyncio.run(run())
+
+
+class AsyncLinkToTrack():
+    """
+    Scrapes track data based on links for:
+
+    - Album
+    - Artist
+    - Playlist
+
+    Requests are made through AsyncSpotApi, 
+        so many links can be resolved concurrently under one concurrency limit
+    """
+
+    # Maximum page sizes allowed by each endpoint
+    LIMIT_PLAYLIST_TRACKS = 100
+    LIMIT_ALBUM_TRACKS = 50
+    LIMIT_ARTIST_ALBUMS = 50
+
+    # Maximum number of albums the multiple albums endpoint returns at once
+    ALBUMS_PER_REQUEST = 20
+
+    # Resolved tracklists are cached on disk
+    DIR_CACHE = '../data/cache/tracklists'
+    CACHE_MAX_BYTES = 200 * 1024 ** 2
+
+    # How long (in seconds) the tracklist of each category is cached for
+    TTL_ALBUM = 90 * 24 * 60 * 60
+    TTL_ARTIST = 24 * 60 * 60
+    TTL_PLAYLIST = 30 * 24 * 60 * 60 # Keyed by snapshot_id, so it can't go stale
+
+    # Cache shared by every instance, see AsyncLinkToTrack.shared_cache()
+    _shared_cache = None
+
+    def __init__(
+        self, 
+        spotapi: SpotApi | None = None, 
+        max_concurrent: int | None = None,
+        cache: DiskCache | None = None
+        ) -> None:
+        """
+        > Parameters <
+        --------------
+        :spotapi:
+            the SpotApi to make requests with
+            DEFAULT: None
+                -> uses the shared SpotApi
+        :max_concurrent:
+            the maximum number of requests in flight at once, across every link
+            DEFAULT: None
+                -> the size of the SpotApi's connection pool
+        :cache:
+            the cache of resolved tracklists
+            DEFAULT: None
+                -> uses the shared cache
+        """
+        self.spotapi = AsyncSpotApi(spotapi, max_concurrent)
+        self.cache = cache or self.shared_cache()
+
+    @classmethod
+    def shared_cache(cls) -> DiskCache:
+        """ Return the tracklist cache shared across the program, creating it on first use """
+        if cls._shared_cache is None:
+            cls._shared_cache = DiskCache(cls.DIR_CACHE, cls.CACHE_MAX_BYTES)
+        return cls._shared_cache
+
+    async def link(self, link:str):
         """
         Given a link 
             (e.g. https://open.spotify.com/playlist/4BaKglpjlo8yoCQccCyZLx?si=d2d9a07aa5144e87)
@@ -48,18 +161,36 @@ class LinkToTrack():
         Call the appropriate method based on :catgeory: with the argument :id_:
         """
         
-        if not self.validate_link(link):
+        if not LinkToTrack.validate_link(link):
             # Invald value
             print(f"Invalid link: {link}")
             return
         
-        category, id_ = self.get_category_and_id(link)
+        category, id_ = LinkToTrack.get_category_and_id(link)
 
         match category:
-            # case 'track': return self.track(id_)
-            case 'album': return self.album(id_)
-            case 'artist': return self.artist(id_)
-            case 'playlist': return self.playlist(id_)
+            # case 'track': return await self.track(id_)
+            case 'album': return await self.album(id_)
+            case 'artist': return await self.artist(id_)
+            case 'playlist': return await self.playlist(id_)
+
+    async def links(self, links:List[str]) -> List[List[Track] | None]:
+        """
+        Given a list of links, resolve them all concurrently
+        Returns the result of self.link for each, in the same order
+            or None for any that couldn't be resolved (e.g. a private or deleted playlist),
+            so one bad link doesn't lose the rest
+        """
+        results = await asyncio.gather(*(self.link(i) for i in links), return_exceptions=True)
+
+        for n, (link, result) in enumerate(zip(links, results)):
+            if isinstance(result, requests.RequestException):
+                print(f"Couldn't resolve link {link}: {result}")
+                results[n] = None
+            elif isinstance(result, BaseException):
+                raise result
+
+        return results
 
     # -----------------------------------
 
@@ -69,97 +200,76 @@ class LinkToTrack():
     ## I even gave this to Chat-OpenAI and it couldn't figure out why this isn't working
     
     # @convert_to_track_object_dec
-    # def track(self, track_id: str) -> Track:
+    # async def track(self, track_id: str) -> Track:
     #     """ 
     #     Given a track_id
     #         - Scrape data about the track
     #         - Accordingly return Track object
     #     """
     #     suburl = f"tracks/{track_id}"
-    #     response_data = self.__scrape_data(suburl)
+    #     response_data = await self.__scrape_data(suburl)
     #     return response_data
 
     # -----------------------------------
 
-    @convert_to_track_object_dec
-    def playlist(self, playlist_id:str) -> List[Track]:
+    async def playlist(self, playlist_id:str) -> List[Track]:
         """ 
         Given a playlist_id
             - Scrape tracklist data
             - Accordingly, return a list of Track objects
-        """
-
-        # Suburl for initial request
-        suburl = f"playlists/{playlist_id}/tracks"
-
-        # List of tracks that will be populated and ultimately returned
-        tracks = list()
-
-        while True:
-
-            # Scrape playlist data
-            response_data = self.__scrape_data(suburl)
-
-            # Extract tracklist data from scraped playlist data
-            tracks_data = self.__get_tracks_data(response_data)
-            tracks_on_page = [i['track'] for i in tracks_data['items']]
-
-            # Add tracks on page to tracklist
-            tracks.extend(tracks_on_page)
 
-            # Assess whether there is a next page
-            # If there isn't, break
-            if not (suburl := tracks_data.get('next')):
-                break
-
-            # Continue scraping next page using updated :suburl: variable
+        Cached by snapshot_id, which changes whenever the playlist does
+            so only the snapshot_id is requested if the playlist hasn't changed
+        """
+        response_data = await self.__scrape_data(f"playlists/{playlist_id}", params={'fields': 'snapshot_id'})
+        key = ('playlist', playlist_id, response_data['snapshot_id'])
 
+        if (tracks := self.cache.get(key)) is None:
+            tracks = await self.__playlist(playlist_id) or []
+            self.cache.set(key, tracks, self.TTL_PLAYLIST)
         return tracks
 
-
     @convert_to_track_object_dec
-    def album(self, album_id:str) -> List[Track]:
+    async def __playlist(self, playlist_id:str) -> List[Track]:
+        """ Scrape every page of the playlist's tracklist """
+        suburl = f"playlists/{playlist_id}/tracks"
+        items = await self.spotapi.paginate(suburl, params={'limit': self.LIMIT_PLAYLIST_TRACKS})
+
+        # Playlist items wrap the track data
+        return [i['track'] for i in items]
+
+    async def album(self, album_id:str) -> List[Track]:
         """ 
         Given an album_id
             - Scrape tracklist data
             - Accordingly, return a list of Track objects
-        """
-
-        # Suburl for initial request
-        suburl = f"albums/{album_id}/tracks"
-
-        # List of tracks that will be populated and ultimately returned
-        tracks = list()
-
-        while True:
-
-            # Scrape album data
-            response_data = self.__scrape_data(suburl)
-
-            # Extract tracklist data from scraped playlist data
-            tracks_data = self.__get_tracks_data(response_data)
-            tracks_on_page = [i for i in tracks_data['items']]
-
-            # Add tracks on page to tracklist
-            tracks.extend(tracks_on_page)
-
-            # Assess whether there is a next page
-            # If there isn't, break
-            if not (suburl := tracks_data.get('next')):
-                break
 
-            # Continue scraping next page using updated :suburl: variable
+        Cached for TTL_ALBUM, as album tracklists rarely change
+        """
+        key = ('album', album_id)
 
+        if (tracks := self.cache.get(key)) is None:
+            tracks = await self.__album(album_id) or []
+            self.cache.set(key, tracks, self.TTL_ALBUM)
         return tracks
 
-    def artist(self, artist_id:str, release_types:list|str = 'ALL') -> List[Track]:
+    @convert_to_track_object_dec
+    async def __album(self, album_id:str) -> List[Track]:
+        """ Scrape every page of the album's tracklist """
+        suburl = f"albums/{album_id}/tracks"
+        return await self.spotapi.paginate(suburl, params={'limit': self.LIMIT_ALBUM_TRACKS})
+
+    async def artist(self, artist_id:str, release_types:list|str = 'ALL') -> List[Track]:
         """ 
         Given an artist_id
             - Scrape tracklist data
             - Accordingly, return a list of Track objects
 
-        NOTE this method doesn't need convert_to_track_object_dec decorator 
-            because it calls methods which have it already
+        Releases are expanded ALBUMS_PER_REQUEST at a time 
+            through the multiple albums endpoint, which embeds each tracklist
+
+        Cached for TTL_ARTIST, as artists put out new releases
+            Once expired, only releases that aren't cached themselves are expanded again
 
         > Params <
         ----------
@@ -168,57 +278,91 @@ class LinkToTrack():
             comma-separated list of album types | str 'ALL' for all types
                 e.g. if set to 'albums': returns only Tracks that are part of an album 
         """
+        key = ('artist', artist_id, release_types)
+        if (tracks := self.cache.get(key)) is not None:
+            return tracks
 
-        # Suburl for initial request
+        # Scrape every page of the artist's releases
         suburl = f"artists/{artist_id}/albums"
+        params = {'limit': self.LIMIT_ARTIST_ALBUMS}
+        if release_types != 'ALL':
+            params.update({'include_groups': release_types})
+        albums = [i['id'] for i in await self.spotapi.paginate(suburl, params=params)]
+
+        # Split the releases into batches for the multiple albums endpoint
+        batches = [
+            albums[i:i+self.ALBUMS_PER_REQUEST] for i in range(0, len(albums), self.ALBUMS_PER_REQUEST)
+        ]
 
         # List of tracks that will be populated and ultimately returned
         tracks = list()
 
-        while True:
+        # Extend the tracks_list with the tracklists of each batch, in release order
+        [tracks.extend(i) for i in await asyncio.gather(*(self.albums(i) for i in batches))]
+
+        self.cache.set(key, tracks, self.TTL_ARTIST)
+        return tracks
 
-            # Scrape artist's releases data
-            params = {} if release_types == 'ALL' else {'include': release_types} 
-            response_data = self.__scrape_data(suburl, params=params)
+    async def albums(self, album_ids:List[str]) -> List[Track]:
+        """
+        Given up to ALBUMS_PER_REQUEST album_ids
+            - Scrape the albums that aren't cached, with their tracklists embedded, in one request
+            - Accordingly, return a list of Track objects
 
-            # Extract releases list data from scraped album data
-            album_data = self.__get_album_data(response_data)
-            albums = [i['id'] for i in album_data['items']]
+        Only albums with more tracks than fit on the embedded page 
+            need further requests for the rest of their tracklist
+        """
+        tracklists = {i: self.cache.get(('album', i)) for i in album_ids}
 
-            # Extend the tracks_list with the tracklist of each album on the page
-            [tracks.extend(self.album(album_id)) for album_id in albums]
+        if (uncached := [k for k, v in tracklists.items() if v is None]):
+            response_data = await self.__scrape_data('albums', params={'ids': ','.join(uncached)})
 
-            # Assess whether there is a next page
-            # If there isn't, break
-            if not (suburl := album_data.get('next')):
-                break
+            # Unavailable albums come back as None
+            albums = list(filter(None, response_data['albums']))
+            results = await asyncio.gather(*(self.__album_from_data(i) for i in albums))
 
-            # Continue scraping next page using updated :suburl: variable
+            for album, album_tracks in zip(albums, results):
+                tracklists[album['id']] = album_tracks or []
+                self.cache.set(('album', album['id']), tracklists[album['id']], self.TTL_ALBUM)
+
+        # List of tracks that will be populated and ultimately returned
+        tracks = list()
+        [tracks.extend(i) for i in tracklists.values() if i]
 
         return tracks
 
+    @convert_to_track_object_dec
+    async def __album_from_data(self, album:dict) -> List[Track]:
+        """ 
+        Given an album's data (from the multiple albums endpoint)
+            return its tracklist, paging through the rest of it if it's only partly embedded
+        """
+        tracks_data = self.__get_tracks_data(album)
+
+        if len(tracks_data['items']) < tracks_data['total']:
+            # Page through the rest of the tracklist, starting from the embedded page
+            suburl = f"albums/{album['id']}/tracks"
+            return await self.spotapi.paginate(suburl, first_page=tracks_data)
+        return tracks_data['items']
+
     """
     ** Utility
     """
 
-    def __scrape_data(self, suburl:str, **kwargs) -> dict:
+    async def __scrape_data(self, suburl:str, **kwargs) -> dict:
         """ 
         Perform get request for given suburl and **kwargs
         Return dict by using json() method on response object
+
+        Raises requests.HTTPError if the request still failed after SpotApi's retries
         """
-        response = self.spotapi.get(suburl, **kwargs)        
-        return response.json()
+        return await self.spotapi.get_json(suburl, **kwargs)
 
     @staticmethod
     def __get_tracks_data(data) -> dict:
         """ Given response data, returns the dictionary which contains track info """
         return data['tracks'] if not 'offset' in data else data
 
-    @staticmethod
-    def __get_album_data(data) -> dict:
-        """ Given response data, returns the dictionary which contains album info """
-        return data['albums'] if not 'offset' in data else data
-
     
 
 if __name__ == '__main__':
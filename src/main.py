@@ -4,27 +4,27 @@
 
 # Local
 from link_to_track import LinkToTrack
-from playlist_updater import PlaylistUpdater
-from everynoise import NewReleases, SearchOptions
+from playlist_updater import PlaylistUpdater, PlaylistWriter
+from players import PLAYERS, create_player
+from prefetch import Prefetcher
+from everynoise import Crawler
+from filters import Filter, FilterMasks, HasPreviewUrl, NewArtists, NewTracks, TrackView, UniqueArtists, UniqueTracks
+from history import ListeningHistory
+from journal import Journal
+from track_columns import AppendedTracks, TrackColumns
 import util
 
 # Other
+from array import array
 import atexit
-import copy
 import os
 import pickle
 import random
-from selenium import webdriver
 import threading
 import time
 from typing import Self
 
 
-# Ignore nonsense errors
-options = webdriver.ChromeOptions()
-options.add_experimental_option('excludeSwitches', ['enable-logging'])
-
-
 class Settings():
     """ Settings for the main application """
 
@@ -33,7 +33,8 @@ class Settings():
         'new': 'track',
         'unique': 'track',
         'shuffle': False,
-        'destination_playlist': None
+        'destination_playlist': None,
+        'player': 'selenium'
     }
     
     def __init__(self) -> None:
@@ -41,6 +42,10 @@ class Settings():
         # Set default attributes
         [self.__setattr__(k,v) for k,v in self.DEFAULTS.items()]
 
+    def __setstate__(self, state):
+        # Settings saved by older versions are missing those added since, so they get the defaults
+        self.__dict__.update({**self.DEFAULTS, **state})
+
     def update(self) -> None:
         
         # Display current (at first execution, default) settings to user
@@ -62,6 +67,9 @@ class Settings():
         if (result := self.choose_shuffle()):
             self.shuffle = result
 
+        if (result := self.choose_player()):
+            self.player = result
+
         # Display updated settings to user
         print(f"Updated settings:\n{self}")
     
@@ -72,6 +80,7 @@ class Settings():
         Unique: {self.unique}
         Shuffle: {self.shuffle}
         Destination Playlist: {self.destination_playlist}
+        Player: {self.player}
         """
 
     def choose_shuffle(self) -> bool | None:
@@ -135,6 +144,15 @@ class Settings():
         
         return choice if choice else None
 
+    def choose_player(self) -> str | None:
+        print(f"\nPlay previews with... | Current: {self.player}")
+
+        # '' -> no change
+        # 'list_option' -> 'list_option'
+        choice = util.select_from_list(list(PLAYERS), allow_none=True)
+
+        return choice if choice else None
+
     def choose_destination_playlist(self) -> str:
         print("\nThe playlist to which any liked tracks will be saved")
 
@@ -157,13 +175,16 @@ class Settings():
 
 class PreviewQueue():
 
-    # File names (without pkl extension)
+    # File names (without extension)
     FN_LISTENED_ARTISTS = '../data/listened_artists'
     FN_LISTENED_TRACKS = '../data/listened_tracks'
 
     # Save file location for queues
     save_file_location = '../queues/'
 
+    # Journal events after which a running queue is saved, so its journal doesn't keep growing
+    COMPACT_EVERY = 200
+
     @classmethod
     def start(cls):
         
@@ -188,12 +209,18 @@ class PreviewQueue():
         self.name = name
 
         # Start queue
-        self.queue = list()
+        self.reset()
 
-        # If program exits, save queue
-        atexit.register(self.queue_save)
+        # Progress is journaled as it's made, and saved with the queue from time to time
+        self.open_journal()
         self.save_enabled = True
 
+        # Liked tracks recovered from the journal, which may not have reached the playlist
+        self.unsent_likes = list()
+
+        # Sends liked tracks to the playlist while the queue runs (see get_user_input_likes)
+        self.playlist_writer = None
+
         # Get settings for queue
         self.settings = Settings()
         self.settings.update()
@@ -202,8 +229,8 @@ class PreviewQueue():
         self.submenu_add()
 
     def __len__(self) -> int:
-        """ Returns the number of tracks in the queue """
-        return len(self.queue)
+        """ Returns the number of tracks left to play in the queue """
+        return len(self.visible) - self.cursor
 
     def __bool__(self) -> bool:
         """ Returns True if the queue is not empty """
@@ -219,22 +246,153 @@ class PreviewQueue():
         if 'lock' in state:
             del state['lock']
 
+        # The tracks are saved separately, in a track columns file (see queue_save)
+        # so only the indices of those in the queue, and the cursor, are pickled with the rest of the queue
+        state.pop('source', None)
+        state.pop('journal', None)
+        state.pop('playlist_writer', None)
+
+        # Saved separately, and only when they've changed (see queue_save)
+        state.pop('_masks', None)
+
         return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        # Queues saved by older versions have no cursor, as played tracks were removed from the queue
+        self.cursor = state.get('cursor', 0)
+        self.unsent_likes = state.get('unsent_likes', list())
+        self.playlist_writer = None
+        self.saved = True
+
+        # Loaded when they're first needed (see masks)
+        self._masks = None
+
+        self.open_journal()
+
+        if 'queue' in state:
+            # Queues saved by older versions pickle the list of tracks with the queue
+            # It's kept as is and written to a track columns file on the next save
+            self.source = tuple(self.__dict__.pop('queue'))
+            self.saved = False
+        elif os.path.exists(self.tracks_file_path):
+            # Opening the track columns file doesn't decode any tracks until they're used
+            # It's opened at the size it was saved at, as tracks appended after that weren't saved with the queue
+            self.source = TrackColumns(self.tracks_file_path, state.get('tracks_size'))
+        else:
+            self.source = tuple()
+
+        # Queues saved by older versions only saved the filtered tracks, so they're all in the queue
+        if 'visible' not in state:
+            self.visible = array('L', range(len(self.source)))
+            self.played = bytearray(len(self.source))
     
     @property
     def file_path(self):
         return os.path.join(self.save_file_location, f"{self.name}.pkl")
 
+    @property
+    def tracks_file_path(self):
+        return os.path.join(self.save_file_location, f"{self.name}.tracks")
+
+    @property
+    def masks_file_path(self):
+        return os.path.join(self.save_file_location, f"{self.name}.masks")
+
+    @property
+    def source_saved(self) -> bool:
+        """ Returns True if self.source is the contents of the saved track columns file """
+        return self.is_tracks_file(self.source)
+
+    def is_tracks_file(self, tracks) -> bool:
+        """ Returns True if tracks are the contents of the queue's track columns file """
+        return (
+            isinstance(tracks, TrackColumns) and tracks.is_whole_file 
+            and os.path.abspath(tracks.file_path) == os.path.abspath(self.tracks_file_path)
+        )
+
+    """
+    ** Tracks
+
+    The queue keeps every track ever added to it, unfiltered, in self.source
+        self.visible is the indices of the tracks in the queue (i.e. that passed the filters), in play order
+        self.cursor is the position in self.visible of the next track to play
+        self.played marks the tracks in self.source that have been played, so they're never shown again
+    
+    Which tracks pass each filter is kept in self.masks, 
+        so changing the filters doesn't run them again and switching one off brings back what it dropped
+        They're saved with the queue, so they aren't rebuilt over every track when it's loaded
+    """
+
+    def reset(self) -> None:
+        """ Empty the queue """
+        self.source = tuple()
+        self.played = bytearray()
+        self.visible = array('L')
+        self.cursor = 0
+        self.saved = False
+        self._masks = FilterMasks(HasPreviewUrl())
+
+    @property
+    def queue(self) -> TrackView:
+        """ The tracks in the queue, in play order (including those played, before the cursor) """
+        return TrackView(self.source, self.visible)
+
+    @property
+    def remaining(self) -> TrackView:
+        """ The tracks left to play, i.e. those from the cursor onwards """
+        return self.queue[self.cursor:]
+
+    @property
+    def masks(self) -> FilterMasks:
+        """ Which of self.source pass each filter, computed as each filter is first used """
+        if self._masks is None:
+            self._masks = self.masks_load()
+        return self._masks
+
+    def masks_load(self) -> FilterMasks:
+        """ The masks saved with the queue, or new ones if there are none for its tracks """
+        try:
+            with open(self.masks_file_path, 'rb') as pf:
+                count, masks = pickle.load(pf)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return FilterMasks(HasPreviewUrl())
+
+        # Saved with tracks the queue wasn't saved with (e.g. the program was killed in between)
+        # Tracks added since the queue was loaded don't count, as the masks are extended over them
+        saved = self.source.saved if isinstance(self.source, AppendedTracks) else self.source
+        if count != len(saved):
+            return FilterMasks(HasPreviewUrl())
+        return masks
+
+    def mark_played(self) -> None:
+        """ Mark the tracks before the cursor in self.played """
+        for i in self.visible[:self.cursor]:
+            self.played[i] = 1
+
+    def set_visible(self, indices: list[int]) -> None:
+        """
+        Replace the queue with new indices of tracks in self.source, none of which have been played
+
+        Tracks played so far are marked in self.played first, so they stay out of the queue
+        self.visible is never modified in place, only replaced, so it can be shared with a running preview
+        """
+        self.mark_played()
+        self.visible = array('L', indices)
+        self.cursor = 0
+        self.saved = False
+
     """
     Misc.
     """
 
     def clear(self):
-        """ Clear the queue, so that the :self.queue: object is now an empty list """
+        """ Clear the queue, removing every track from it """
         if not util.yn(f"Are you sure you want to clear the queue?"):
             return
         
-        self.queue.clear()
+        self.reset()
 
     def delete(self):
         """ Delete the file associated w/ the instance and disabling saving on exit """
@@ -245,8 +403,11 @@ class PreviewQueue():
         # In case this the atexit signal is not overwritten
         self.save_enabled = False
         
-        # Delete the queue file
-        os.remove(self.file_path)
+        # Delete the queue files
+        for file_path in (self.file_path, self.tracks_file_path, self.masks_file_path):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        self.journal.clear()
 
         return
 
@@ -277,19 +438,100 @@ class PreviewQueue():
         with open(choice, 'rb') as pf:
             preview_queue = pickle.load(pf)
         print(f"Loaded queue {preview_queue.name}")
-        atexit.register(preview_queue.queue_save)
+        preview_queue.replay_journal()
         return preview_queue
     
     def queue_save(self):
-        """ Save the queue as a pickle file """
+        """ 
+        Save the queue as a pickle file 
+            with its tracks in a separate track columns file (see track_columns)
+        
+        Tracks added since the last save are written to the end of the track columns file, so it isn't rewritten
+            and the filter masks are written to their own file, if they've changed (see masks)
+        Playing or filtering tracks only changes the cursor and indices, so then just the (small) pickle is written
+
+        Everything in the journal is then part of the save, so it's compacted (i.e. cleared)
+            So the listening histories are flushed to disk first, 
+            and liked tracks not yet sent to the playlist are saved with the queue, to be sent on the next run
+        """
 
         if not self.save_enabled:
             return
-        
-        with open(self.file_path, 'wb') as pf:
-            pickle.dump(self, pf)
+
+        def save():
+            # What the journal's 'played' and 'liked' events record must be saved before they're cleared
+            self.listened_tracks.flush()
+            self.listened_artists.flush()
+            if self.playlist_writer is not None:
+                self.unsent_likes = self.playlist_writer.pending
+
+            if isinstance(self.source, AppendedTracks) and self.is_tracks_file(self.source.saved):
+                self.source = self.source.saved.append(self.source.appended)
+            elif not self.source_saved:
+                self.source = TrackColumns.write(self.tracks_file_path, self.source)
+            self.tracks_size = self.source.size
+            self.saved = True
+
+            if self._masks is not None and self._masks.changed:
+                temp_path = f"{self.masks_file_path}.tmp"
+                with open(temp_path, 'wb') as pf:
+                    pickle.dump((len(self.source), self._masks), pf)
+                os.replace(temp_path, self.masks_file_path)
+                self._masks.changed = False
+            
+            # Write to a temporary file first, so a save cut short never replaces the last one
+            temp_path = f"{self.file_path}.tmp"
+            with open(temp_path, 'wb') as pf:
+                pickle.dump(self, pf)
+            os.replace(temp_path, self.file_path)
+
+        self.journal.compact(save)
         print(f"Saved queue {self.name}")
 
+    """
+    ** Journal
+    """
+
+    def open_journal(self) -> None:
+        """ Open the journal of progress made since the queue was last saved """
+        self.journal = Journal(os.path.join(self.save_file_location, self.name))
+
+        # Make sure the last few events are fsynced
+        atexit.register(self.journal.close)
+
+    def replay_journal(self) -> None:
+        """
+        Apply the events journaled since the queue was last saved,
+            i.e. progress made before the program was killed,
+            then save the queue with them
+
+        > Events <
+        ----------
+        ['played', track id, artist ids]
+            the track was listened to
+        ['cursor', cursor]
+            the cursor moved
+        ['liked', track uri]
+            the track was liked (it's sent to the playlist again on the next run, in case it wasn't)
+        """
+        events = list(self.journal.replay())
+        if not events:
+            return
+
+        for event, *args in events:
+            match event:
+                case 'played':
+                    track_id, artist_ids = args
+                    self.listened_tracks.update([track_id])
+                    self.listened_artists.update(artist_ids)
+                case 'cursor':
+                    self.cursor = min(args[0], len(self.queue))
+                case 'liked':
+                    self.unsent_likes.append(args[0])
+
+        print(f"Recovered {len(events)} events from the last session")
+        self.queue_save()
+
     """
     ** Run
     """
@@ -299,11 +541,14 @@ class PreviewQueue():
         
         self.lock = threading.Lock()
 
-        # Create copy of queue
-        # This is necessary because the self.queue will be stipped as the program runs
-        # And if the user saves a track (e.g. 35), we must still be able to retrieve
-        # the appropriate index
-        self.original_queue = copy.copy(self.queue)
+        # The cursor journaled as tracks play is a position in the saved queue, so it must be up to date
+        if not self.saved:
+            self.queue_save()
+
+        # Where this run starts in the queue
+        # Tracks are numbered from here, so a liked track (e.g. 35) is found at run_start + 34
+        # Played tracks stay in self.queue (only the cursor moves), so this works throughout the run
+        self.run_start = self.cursor
 
         self.stop_preview = False
 
@@ -320,7 +565,7 @@ class PreviewQueue():
 
 
     def preview_tracks(self):
-        """ Run the queue - i.e. play tracks through Selenium webdriver """
+        """ Run the queue - i.e. play tracks through the player in self.settings (see players) """
 
         # Ensure there are tracks in the queue
         if not self:
@@ -329,36 +574,71 @@ class PreviewQueue():
 
         print(f"Tracks to play: {len(self)}")
 
-        # Start webdriver
-        driver = webdriver.Chrome(options = options)
+        # Start the player
+        player = create_player(self.settings.player)
+        try:
+            player.start()
+        except Exception as e:
+            # e.g. Chrome or the audio player isn't installed
+            print(f"\nCouldn't start the {player.name} player: {e}")
+            return
+
+        # Previews are downloaded a few tracks ahead, so each plays from a local file straight away
+        prefetcher = Prefetcher()
 
-        # Play tracks
-        counter = 1
-        while self:
+        # The player and downloads are stopped however playing ends, so no browser or audio player is left running
+        try:
+            # Play tracks
+            counter = 1
+            while self:
             
-            track = self.queue[0]
-            driver.get(str(track.preview_url))
+                track = self.queue[self.cursor]
+                prefetcher.prefetch(i.preview_url for i in self.queue[self.cursor:self.cursor+prefetcher.ahead+1])
 
-            print(f"#{counter:4}: {track}")
+                # Fall back to streaming the preview if it couldn't be downloaded
+                file_path = prefetcher.get(track.preview_url)
+                player.play(file_path or str(track.preview_url))
 
-            time.sleep(self.settings.listen_time)
+                print(f"#{counter:4}: {track}")
 
-            if self.stop_preview:
-                # User exited the get_user_input_likes func
-                break
+                time.sleep(self.settings.listen_time)
+
+                if self.stop_preview:
+                    # User exited the get_user_input_likes func
+                    break
 
-            # Update pickle files
-            # Do this each time to save progress in case user quits program
-            self.listened_artists = self.listened_artists + track.artist_ids
-            self.listened_tracks = self.listened_tracks + [track.id_]
+                # Update listening history
+                # Do this each time to save progress in case user quits program
+                self.listened_artists.update(track.artist_ids)
+                self.listened_tracks.update([track.id_])
 
-            # Remove track from queue
-            self.queue = self.queue[1:]
+                # Move on to the next track
+                self.cursor += 1
+
+                # Journal the progress, so it isn't lost if the program is killed
+                self.journal.append(['played', track.id_, track.artist_ids], ['cursor', self.cursor])
+                if len(self.journal) >= self.COMPACT_EVERY:
+                    self.queue_save()
             
-            counter += 1
+                counter += 1
+        finally:
+            player.close()
+            prefetcher.close()
+        print(prefetcher.report())
 
     def get_user_input_likes(self):
-        playlist_updater = PlaylistUpdater(self.settings.destination_playlist)
+        # Liked tracks are added to the playlist in the background, so input is never held up
+        playlist_writer = PlaylistWriter(PlaylistUpdater(self.settings.destination_playlist))
+
+        # Saves take the likes it hasn't sent yet, as they clear the journal (see queue_save)
+        self.playlist_writer = playlist_writer
+
+        # Send the likes recovered from the journal again, in case they never made it
+        # Those already in the playlist are skipped
+        for track_uri in self.unsent_likes:
+            if playlist_writer.add(track_uri):
+                self.journal.append(['liked', track_uri])
+        self.unsent_likes = list()
 
         while True:
             user_input = input('')
@@ -368,15 +648,27 @@ class PreviewQueue():
                 # Save the selected track to playlist
                 with self.lock:
                     try:
-                        liked_track = self.original_queue[int(user_input)-1]
+                        liked_track = self.queue[self.run_start + int(user_input)-1]
                     except IndexError:
                         print(f"Invalid number: {user_input}")
                     else:
-                        playlist_updater.track_to_playlist(liked_track.uri)
-                        print(f"Added to playlist: {liked_track}")
+                        if playlist_writer.add(liked_track.uri):
+                            self.journal.append(['liked', liked_track.uri])
+                            print(f"Added to playlist: {liked_track}")
+                        else:
+                            print(f"Already in playlist: {liked_track}")
             else:
                 print(f"Invalid input: {user_input}")
 
+        # Send any likes still waiting to be added
+        playlist_writer.close()
+        self.playlist_writer = None
+
+        # Those it gave up on are saved with the queue, and sent again on the next run
+        self.unsent_likes = playlist_writer.pending
+        if self.unsent_likes:
+            self.saved = False
+
     def menu(self) -> None:
         """ 
         The Main Menu for the queue 
@@ -397,6 +689,10 @@ class PreviewQueue():
         }
 
         while True:
+
+            # Save whenever the queue changes, as only progress through it is journaled
+            if not self.saved:
+                self.queue_save()
             
             print(f'\n{util.title("Main Menu")}')
             print(f"\nCurrent queue: {len(self)} tracks\n")
@@ -436,10 +732,37 @@ class PreviewQueue():
             choice_func = util.select_from_dict({'Link': self.add_from_link, 'Everynoise': self.add_from_everynoise}, zeroth='Go back')
             if not choice_func:
                 break
-            results = choice_func()
-            self.queue += results
+            self.append(choice_func())
 
-        self.filter()
+    def append(self, tracks: list) -> None:
+        """
+        Add new tracks to the queue, filtered, at the end
+            or, if shuffling, at random positions among the tracks left to play
+
+        Only the new tracks are filtered (see FilterMasks), and the tracks already saved aren't decoded or copied
+            (see AppendedTracks), so this takes time in proportion to the new tracks
+        """
+        start = len(self.source)
+        if not isinstance(self.source, AppendedTracks):
+            self.source = AppendedTracks(self.source)
+        self.source.extend(tracks)
+        self.played.extend(bytes(len(tracks)))
+
+        new = self.masks.select(self.filters(), self.source, start, exclude=self.played)
+        print(f"\nAdded {len(new)} of {len(tracks)} tracks\n{self.masks.report()}")
+
+        remaining = self.visible[self.cursor:]
+        if not self.settings.shuffle:
+            self.set_visible([*remaining, *new])
+            return
+
+        # Pick random positions for the new tracks in the merged queue, then fill it in
+        # The tracks already in the queue keep their order
+        random.shuffle(new)
+        total = len(remaining) + len(new)
+        positions = set(random.sample(range(total), len(new)))
+        remaining, new = iter(remaining), iter(new)
+        self.set_visible([next(new) if i in positions else next(remaining) for i in range(total)])
 
     def add_from_link(self) -> None:
         """ 
@@ -447,7 +770,7 @@ class PreviewQueue():
         """
 
         link_to_track = LinkToTrack()
-        tracks = []
+        links = []
 
         while True:
             selection = input("\nEnter a URL or enter 'fin' to finish\n> ").strip()
@@ -459,7 +782,11 @@ class PreviewQueue():
                 print(f"Invalid link: {selection}")
                 continue
 
-            results = link_to_track.link(selection)
+            links.append(selection)
+
+        # Resolve all the links at once, so they're scraped concurrently
+        tracks = []
+        for results in link_to_track.links(links):
             if results:
                 tracks.extend(results)
 
@@ -469,127 +796,87 @@ class PreviewQueue():
     def add_from_everynoise(self, similar=True) -> None:
         """
         Add to queue given a everynoise new_releases and optional genre filter
+            Several genres can be given at once, separated by commas
         """
-        genre = input("Genre: ")
-        nr = NewReleases(genre=genre) if genre else NewReleases()
-        
-        if nr.genre != 'anygenre' and util.yn("Include similar?", allow_none=True):
-            return nr.tracks_and_similar
-        return nr.tracks
+        crawler = Crawler()
+        genre_index = crawler.search_options.genre_index
+
+        given = [i.strip() for i in input("Genre(s), comma-separated: ").split(',') if i.strip()]
+
+        genres = list()
+        for genre in given:
+            if genre not in genre_index:
+                # Offer the closest genres rather than giving up on the lot
+                if not (suggestions := genre_index.suggest(genre)):
+                    print(f"\nUnknown genre: {genre}")
+                    continue
+                print(f"\nUnknown genre: {genre}. Did you mean...")
+                if not (genre := util.select_from_list(suggestions, allow_none=True)):
+                    continue
+            genres.append(genre)
+
+        # Any genre only if none were given, not if every one given was unknown
+        if given and not genres:
+            print("\nNo valid genres given")
+            return list()
+
+        genres = list(dict.fromkeys(genres)) or ['anygenre']
+
+        include_similar = genres != ['anygenre'] and util.yn("Include similar?", allow_none=True)
+        return crawler.crawl(genres, similar=bool(include_similar))
 
     """
     ** Filters
     """
 
-    def filter(self) -> None:
-        """ Filter tracks based on self.settings """
-        self.filter_has_preview_url()
+    def filters(self) -> list[Filter]:
+        """ The filters for self.settings, besides HasPreviewUrl (which every track must pass, see masks) """
+        filters = list()
 
         match self.settings.new:
-            case 'OFF':
-                pass
             case 'track':
-                self.filter_track_new()
+                filters.append(NewTracks(self.listened_tracks.ids))
             case 'artist':
-                self.filter_artist_new()
+                filters.append(NewArtists(self.listened_artists.ids))
 
         match self.settings.unique:
-            case 'OFF':
-                pass
             case 'track':
-                self.filter_tracks_unique()
+                filters.append(UniqueTracks())
             case 'artist':
-                self.filter_artist_unique()
-        
-        if self.settings.shuffle:
-            self.shuffle()
-
+                filters.append(UniqueArtists())
 
-    def filter_has_preview_url(self) -> None:
-        """ 
-        Filter the queue to remove any tracks without a preview URL
-        This filter must be used because tracks 
-        without a preview URL are not playabale!
-        """
-        self.queue = [i for i in self.queue if i.preview_url]
+        return filters
 
-    def filter_track_new(self) -> None:
+    def filter(self) -> None:
         """ 
-        Filter the queue to include only tracks that the user 
-        has not listened to yet using the program
-        """
-        self.queue = [i for i in self.queue if i.id_ not in self.listened_tracks]
+        Refilter the queue for self.settings, e.g. after they've changed
 
-    def filter_artist_new(self) -> None:
-        """
-        Filter the queue to include only artists that the user
-        has not listened to yet using the program
-        """
-        self.queue = [
-            i for i in self.queue if not all([j[0] in self.listened_artists for j in i.artists])
-        ]
-
-    def filter_tracks_unique(self) -> None:
-        """
-        Filter the queue to include only unique tracks
+        Every track ever added that passes the filters and hasn't been played is put back in the queue
+        The masks of filters already used are combined as they are, so only new filters are run
         """
-        self.queue = list(set(self.queue))
+        count = len(self)
+        self.mark_played()
+        visible = self.masks.select(self.filters(), self.source, exclude=self.played)
+        print(f"\nFiltered {len(self.source)} tracks to {len(visible)} (was {count})\n{self.masks.report()}")
 
-    def filter_artists_unique(self) -> None:
-        """
-        Filter to queue to include only unique artists
-        """
-        unique_artists = set()
-        filtered_tracks = []
-
-        def assess_track(track:dict):
-            artist_ids = track.artist_ids
-            if not all([i in unique_artists for i in artist_ids]):
-                unique_artists.update(set(artist_ids))
-                filtered_tracks.append(track)
-
-        [assess_track(i) for i in self.queue]
-        self.queue = filtered_tracks
+        if self.settings.shuffle:
+            random.shuffle(visible)
 
-    def shuffle(self):
-        """ Shuffle the queue """
-        random.shuffle(self.queue)
+        self.set_visible(visible)
 
     """
     ** Listened to
     """
 
     @property
-    def listened_tracks(self) -> None:
+    def listened_tracks(self) -> ListeningHistory:
         """ Tracks the user has listened to already using this program """
-        try:
-            return util.load_pkl(self.FN_LISTENED_TRACKS)
-        except FileNotFoundError:
-            # Assume file not created yet 
-            # So user has not listened to any tracks with the program
-            return list()
-
-    @listened_tracks.setter
-    def listened_tracks(self, track_ids):
-        """ Write to the file track_ids that the user has listened to 
-        NOTE: This will override the existing contents 
-        """
-        util.save_pkl(self.FN_LISTENED_TRACKS, track_ids)
+        return ListeningHistory.load(self.FN_LISTENED_TRACKS)
 
     @property
-    def listened_artists(self) -> None:
+    def listened_artists(self) -> ListeningHistory:
         """ Artists the user has listened to already using this program """
-        try:
-            return util.load_pkl(self.FN_LISTENED_ARTISTS) 
-        except FileNotFoundError:
-            return list()
-
-    @listened_artists.setter
-    def listened_artists(self, artist_ids):
-        """ Write to the file artist_ids that the user has listened to 
-        NOTE: This will override the existing contents 
-        """
-        util.save_pkl(self.FN_LISTENED_ARTISTS, artist_ids)
+        return ListeningHistory.load(self.FN_LISTENED_ARTISTS)
 
 
 
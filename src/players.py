@@ -0,0 +1,144 @@
+"""
+    Module for playing track previews
+        Each player is a backend for PreviewQueue.preview_tracks,
+        chosen by name in the queue's settings (see PLAYERS)
+"""
+
+# Other
+import pathlib
+import shutil
+import subprocess
+
+
+class Player():
+    """
+    Plays preview clips, one at a time
+
+    start() gets the player ready (e.g. launches a browser), so it's only paid for once per run
+    play() starts a clip without waiting for it to finish, stopping any clip still playing
+    close() stops playing and frees everything the player started
+    """
+
+    # Name of the player in the settings
+    name = None
+
+    def start(self) -> None:
+        pass
+
+    def play(self, source: str) -> None:
+        """ Start playing a clip, given its file path or URL """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    @property
+    def pid(self) -> int | None:
+        """ The id of the process the player runs in, if it has its own (e.g. to measure its memory) """
+        return None
+
+    @staticmethod
+    def _is_url(source: str) -> bool:
+        return source.startswith(('http://', 'https://', 'file://'))
+
+
+class SeleniumPlayer(Player):
+    """ Opens each clip in Chrome, through Selenium webdriver """
+
+    name = 'selenium'
+
+    def __init__(self):
+        self.driver = None
+
+    def start(self) -> None:
+        # Imported here, so the other players work without Selenium installed
+        from selenium import webdriver
+
+        # Ignore nonsense errors
+        options = webdriver.ChromeOptions()
+        options.add_experimental_option('excludeSwitches', ['enable-logging'])
+
+        self.driver = webdriver.Chrome(options = options)
+
+    def play(self, source: str) -> None:
+        if not self._is_url(source):
+            source = pathlib.Path(source).resolve().as_uri()
+        self.driver.get(source)
+
+    def close(self) -> None:
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+
+    @property
+    def pid(self) -> int | None:
+        # chromedriver, which Chrome's processes run under
+        return self.driver.service.process.pid if self.driver is not None else None
+
+
+class LocalPlayer(Player):
+    """
+    Plays each clip with a command line audio player, in a subprocess
+    Much lighter than a browser, and works on machines without a display
+    Uses the first of COMMANDS that's installed
+    """
+
+    name = 'local'
+
+    # {executable: arguments to play a file or URL quietly and exit}
+    COMMANDS = {
+        'mpg123': ['-q'],
+        'ffplay': ['-nodisp', '-autoexit', '-loglevel', 'quiet'],
+    }
+
+    def __init__(self):
+        self.command = None
+        self._process = None
+
+    def start(self) -> None:
+        for executable, args in self.COMMANDS.items():
+            if (path := shutil.which(executable)):
+                self.command = [path, *args]
+                return
+        raise RuntimeError(f"No audio player found, install one of: {', '.join(self.COMMANDS)}")
+
+    def play(self, source: str) -> None:
+        self._stop()
+        self._process = subprocess.Popen(
+            [*self.command, source],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    def close(self) -> None:
+        self._stop()
+
+    def _stop(self) -> None:
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            self._process.wait()
+        self._process = None
+
+    @property
+    def pid(self) -> int | None:
+        return self._process.pid if self._process is not None else None
+
+
+class NullPlayer(Player):
+    """ Plays nothing, only keeps a list of the clips it's given (for testing and benchmarks) """
+
+    name = 'null'
+
+    def __init__(self):
+        self.played = list()
+
+    def play(self, source: str) -> None:
+        self.played.append(source)
+
+
+# {name: player class} of every player
+PLAYERS = {i.name: i for i in (SeleniumPlayer, LocalPlayer, NullPlayer)}
+
+
+def create_player(name: str) -> Player:
+    """ Returns a new player of the given name (see PLAYERS) """
+    return PLAYERS[name]()
@@ -2,27 +2,120 @@
     Module for updating playlists on Spotify
 """
 from spotapi import SpotApi
+from track import Track
+import util
+
+import requests
+import threading
 
 
 class PlaylistUpdater():
 
-    def __init__(self, playlist_id: str):
+    # Maximum number of tracks that can be added in one request
+    MAX_TRACKS_PER_REQUEST = 100
+
+    # Maximum page size when reading the playlist's tracks
+    LIMIT_PLAYLIST_TRACKS = 100
+
+    # File name (without pkl extension) of the cached index of the playlist's tracks
+    FN_INDEX = '../data/playlist_index_{}'
+
+    def __init__(self, playlist_id: str, spotapi: SpotApi | None = None):
         """
         > Params <
         ----------
         :playlist_id:
             the id of the playlist you wish to update
+        :spotapi:
+            the SpotApi to make requests with
+            DEFAULT: None
+                -> uses the shared SpotApi
         """
-        self.spotapi = SpotApi()
+        self.spotapi = spotapi or SpotApi.shared()
         self.playlist_id = playlist_id
 
+        # Index of the ids of the tracks in the playlist, loaded on first use
+        self._track_ids = None
+        self._snapshot_id = None
+        self._index_lock = threading.RLock()
+
+    """
+    ** Index
+    """
+
+    @property
+    def track_ids(self) -> set:
+        """ 
+        The ids of the tracks in the playlist
+
+        Loaded from the cached index if the playlist hasn't changed since (same snapshot_id)
+        Otherwise, every page of the playlist is fetched (concurrently) to build it
+        """
+        with self._index_lock:
+            if self._track_ids is None:
+                self._load_index()
+            return self._track_ids
+
+    def contains(self, track_uri: str) -> bool:
+        """ 
+        Returns True if the track is known to already be in the playlist
+        Never waits on the network, so returns False if the index hasn't been loaded yet
+        """
+        track_ids = self._track_ids
+        return track_ids is not None and self._uri_to_id(track_uri) in track_ids
+
+    def _load_index(self) -> None:
+        """ Set self._track_ids and self._snapshot_id, from the cache if it's still valid """
+        snapshot_id = self.spotapi.get_json(
+            f"playlists/{self.playlist_id}", params={'fields': 'snapshot_id'}
+        )['snapshot_id']
+
+        try:
+            cached = util.load_pkl(self.FN_INDEX.format(self.playlist_id))
+        except (FileNotFoundError, EOFError):
+            cached = None
+
+        if cached and cached['snapshot_id'] == snapshot_id:
+            self._track_ids = cached['track_ids']
+            self._snapshot_id = snapshot_id
+            return
+
+        items = self.spotapi.paginate(
+            f"playlists/{self.playlist_id}/tracks", 
+            params={'limit': self.LIMIT_PLAYLIST_TRACKS, 'fields': 'items(track(id)),total,limit,offset'}
+        )
+
+        # Removed tracks come back as None
+        self._track_ids = {i['track']['id'] for i in items if i['track']}
+        self._snapshot_id = snapshot_id
+        self._save_index()
+
+    def _save_index(self) -> None:
+        """ Cache the index, along with the snapshot_id it is valid for """
+        util.save_pkl(
+            self.FN_INDEX.format(self.playlist_id), 
+            {'snapshot_id': self._snapshot_id, 'track_ids': self._track_ids}
+        )
+
+    @staticmethod
+    def _uri_to_id(track_uri: str) -> str:
+        return track_uri.removeprefix(Track.URI_PREFIX)
+
+    """
+    ** Add
+    """
+
     def tracks_to_playlist(
         self,
-        track_uris: str,
+        track_uris: list,
         position: int | None = None 
     ):
         """ 
         Add tracks to a playlist given their URIs 
+        The URIs are sent in the request body, MAX_TRACKS_PER_REQUEST at a time
+        Tracks already in the playlist (or repeated in track_uris) are skipped
+
+        Raises requests.HTTPError if a request still failed after SpotApi's retries
 
         > Params <
         ----------
@@ -33,9 +126,28 @@ class PlaylistUpdater():
             DEFAULT: None 
                 -> appends track to end of playlist
         """
-        params = {'uris': track_uris}
-        if position: params.update({'position': position})
-        self.spotapi.post(url = f"playlists/{self.playlist_id}/tracks", params = params)
+        with self._index_lock:
+            track_ids = self.track_ids
+
+            # dict.fromkeys removes repeats while keeping the order
+            track_uris = [
+                i for i in dict.fromkeys(track_uris) if self._uri_to_id(i) not in track_ids
+            ]
+
+            for i in range(0, len(track_uris), self.MAX_TRACKS_PER_REQUEST):
+                batch = track_uris[i:i+self.MAX_TRACKS_PER_REQUEST]
+                data = {'uris': batch}
+                if position is not None: data.update({'position': position + i})
+
+                response = self.spotapi.post(url = f"playlists/{self.playlist_id}/tracks", json = data)
+                response.raise_for_status()
+
+                # Keep the index current, so the cache stays valid for the new snapshot
+                track_ids.update(self._uri_to_id(j) for j in batch)
+                self._snapshot_id = response.json()['snapshot_id']
+
+            if track_uris:
+                self._save_index()
 
     def track_to_playlist(
         self,
@@ -56,6 +168,140 @@ class PlaylistUpdater():
         """
         self.tracks_to_playlist([track_uri], position)
 
+
+
+class PlaylistWriter():
+    """
+    Adds tracks to a playlist in the background
+
+    URIs are queued by add() without waiting on the network
+    Tracks already in the playlist are skipped (see PlaylistUpdater.track_ids)
+    A thread sends them in batches every FLUSH_INTERVAL seconds, in the order they were added
+    A batch that fails is retried (with a growing delay) before any later URIs are sent
+    """
+
+    # Seconds between flushes
+    FLUSH_INTERVAL = 1
+
+    # Longest delay between retries of a failed batch
+    RETRY_DELAY_MAX = 60 # seconds
+
+    # Retries of a failed batch once closed, before the remaining tracks are given up on
+    CLOSE_RETRIES = 3
+
+    def __init__(self, playlist_updater: PlaylistUpdater):
+        """
+        > Params <
+        ----------
+        :playlist_updater:
+            the PlaylistUpdater for the playlist the tracks are added to
+        """
+        self.playlist_updater = playlist_updater
+
+        # URIs waiting to be added, oldest first
+        self._pending = list()
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    def add(self, track_uri: str) -> bool:
+        """ 
+        Queue a track to be added to the playlist 
+        Returns False if it's already in the playlist or queued
+        """
+        with self._condition:
+            if track_uri in self._pending or self.playlist_updater.contains(track_uri):
+                return False
+            self._pending.append(track_uri)
+            return True
+
+    @property
+    def pending(self) -> list[str]:
+        """ The URIs queued but not yet added to the playlist, oldest first """
+        with self._condition:
+            return list(self._pending)
+
+    def close(self) -> None:
+        """ Send any remaining tracks, then stop the background thread """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def flush(self) -> bool:
+        """
+        Send the next batch of pending tracks
+        Returns False if the batch failed, in which case it stays at the front of the queue
+        """
+        with self._condition:
+            batch = self._pending[:PlaylistUpdater.MAX_TRACKS_PER_REQUEST]
+
+        if not batch:
+            return True
+
+        try:
+            self.playlist_updater.tracks_to_playlist(batch)
+        except requests.RequestException as e:
+            if not self._is_permanent(e):
+                print(f"Failed to add {len(batch)} track(s) to playlist, will retry: {e}")
+                return False
+
+            # Retrying can't help (e.g. a bad URI, or a playlist the user can't edit)
+            # so drop the batch rather than hold up every later track
+            print(f"Couldn't add {len(batch)} track(s) to playlist, skipping them: {e}")
+            with self._condition:
+                del self._pending[:len(batch)]
+            return True
+
+        with self._condition:
+            del self._pending[:len(batch)]
+        return True
+
+    @staticmethod
+    def _is_permanent(error: requests.RequestException) -> bool:
+        """ Returns True for client errors (4xx) that will fail again however often they're retried """
+        response = getattr(error, 'response', None)
+        if response is None:
+            # e.g. the connection failed
+            return False
+        return 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+
+    def _flush_loop(self) -> None:
+        """ Flush pending tracks every FLUSH_INTERVAL seconds until closed and empty """
+
+        # Load the playlist's index up front, so add() can spot duplicates straight away
+        try:
+            self.playlist_updater.track_ids
+        except requests.RequestException as e:
+            print(f"Failed to load playlist, will retry: {e}")
+
+        delay = self.FLUSH_INTERVAL
+        failures = 0
+        while True:
+            # The only wait in the loop: FLUSH_INTERVAL between flushes, or the retry delay after a failure
+            # A full batch, or once closed what's left, is sent straight away unless the last batch failed
+            # close() cuts a wait short
+            with self._condition:
+                if self._closed and not self._pending:
+                    return
+                if failures or (not self._closed and len(self._pending) < PlaylistUpdater.MAX_TRACKS_PER_REQUEST):
+                    self._condition.wait(timeout=delay)
+
+            if self.flush():
+                failures = 0
+                delay = self.FLUSH_INTERVAL
+                continue
+
+            failures += 1
+            delay = min(self.RETRY_DELAY_MAX, self.FLUSH_INTERVAL * 2 ** failures)
+
+            # Don't hold up exit forever
+            if self._closed and failures > self.CLOSE_RETRIES:
+                print(f"Gave up adding to playlist: {self._pending}")
+                return
+
     
 if __name__ == '__main__':
     pass
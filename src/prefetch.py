@@ -0,0 +1,140 @@
+"""
+    Module for downloading track previews ahead of playback
+        Clips are saved to a size-bounded on-disk cache,
+        so each preview plays from a local file instead of waiting on the network
+"""
+
+# Local
+from cache import FileCache
+from spotapi import create_session
+
+# Other
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import statistics
+import threading
+import time
+from typing import Iterable
+
+
+class Prefetcher():
+    """
+    Downloads preview clips in the background, a few tracks ahead of the one playing
+
+    prefetch() starts downloading the clips that will be played next
+    get() returns the local file of a clip, waiting for its download only if it isn't finished
+
+    Clips played straight from the cache count as hits in self.stats,
+        those that had to be waited on (or downloaded there and then) as misses
+    The time each download took is kept in self.fetch_times
+    """
+
+    # Cache of the clips, kept between runs (preview URLs never change what they point to)
+    DIR_CACHE = '../data/cache/previews'
+    CACHE_MAX_BYTES = 200 * 1024 ** 2
+
+    # Number of clips downloaded ahead of the one playing, and at once
+    AHEAD = 5
+    MAX_WORKERS = 4
+
+    # Seconds to wait for a clip before giving up on it
+    TIMEOUT = 10
+
+    # Cache shared by every Prefetcher, created when first needed
+    _cache = None
+    _cache_lock = threading.Lock()
+
+    def __init__(self, ahead: int = AHEAD, max_workers: int = MAX_WORKERS):
+        """
+        > Parameters <
+        --------------
+        :ahead:
+            the number of clips to download ahead of the one playing
+        :max_workers:
+            the maximum number of clips downloaded at once
+        """
+        self.ahead = ahead
+        self.cache = self.shared_cache()
+
+        self.session = create_session(pool_size=max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        # {preview_url: Future of its file path} of the downloads started
+        self._downloads = dict()
+        self._lock = threading.Lock()
+
+        self.stats = {'hits': 0, 'misses': 0, 'failures': 0}
+        self.fetch_times = list()
+
+    @classmethod
+    def shared_cache(cls) -> FileCache:
+        """ The cache of clips, created the first time it's needed """
+        with cls._cache_lock:
+            if cls._cache is None:
+                cls._cache = FileCache(cls.DIR_CACHE, cls.CACHE_MAX_BYTES, extension='mp3')
+            return cls._cache
+
+    def prefetch(self, preview_urls: Iterable[str]) -> None:
+        """ Start downloading any of the clips that aren't cached or downloading already """
+        with self._lock:
+            for preview_url in preview_urls:
+                if preview_url and preview_url not in self._downloads:
+                    self._downloads[preview_url] = self.executor.submit(self._download, preview_url)
+
+    def get(self, preview_url: str) -> str | None:
+        """
+        Returns the file path of the clip, downloading it first if need be
+        or None if it couldn't be downloaded or cached, so the clip is streamed from its URL instead
+        """
+        with self._lock:
+            download = self._downloads.pop(preview_url, None)
+
+        try:
+            if download is not None:
+                hit = download.done()
+                file_path = download.result(timeout=self.TIMEOUT)
+            else:
+                # Not prefetched, but it may have been cached by an earlier run
+                hit = (file_path := self.cache.get(preview_url)) is not None
+                if not hit:
+                    file_path = self._download(preview_url)
+        # OSError: e.g. the cache's disk is full (TimeoutError is one too)
+        except (requests.RequestException, OSError) as e:
+            self.stats['misses'] += 1
+            self.stats['failures'] += 1
+            print(f"Couldn't download the preview {preview_url}: {e}")
+            return None
+
+        self.stats['hits' if hit else 'misses'] += 1
+        return file_path
+
+    def _download(self, preview_url: str) -> str:
+        """ Returns the file path of the clip from the cache, downloading it if it's not there """
+        if (file_path := self.cache.get(preview_url)):
+            return file_path
+
+        start = time.perf_counter()
+        response = self.session.get(preview_url, timeout=self.TIMEOUT)
+        response.raise_for_status()
+        self.fetch_times.append(time.perf_counter() - start)
+
+        return self.cache.set(preview_url, response.content)
+
+    def close(self) -> None:
+        """ Stop any downloads that haven't started, and close the connections """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def report(self) -> str:
+        """ The share of clips played from the cache, and how long downloads took """
+        played = self.stats['hits'] + self.stats['misses']
+        hit_rate = self.stats['hits'] / played if played else 0
+        report = f"Previews played from cache: {hit_rate:.0%} ({self.stats['hits']}/{played})"
+
+        if self.fetch_times:
+            report += (
+                f" | downloads: {len(self.fetch_times)}, "
+                f"mean {statistics.mean(self.fetch_times) * 1000:.0f} ms, "
+                f"max {max(self.fetch_times) * 1000:.0f} ms"
+            )
+        return report
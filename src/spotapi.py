@@ -1,9 +1,14 @@
+import asyncio
 import base64
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import os
-import pendulum
 import pickle
+import random
 import requests
+from requests.adapters import HTTPAdapter
+import threading
+import time
 from typing import Callable
 
 
@@ -12,10 +17,21 @@ load_dotenv()
 
 
 class Token:
+    """
+    Access token for the WebAPI, refreshed automatically
+
+    The token is only refreshed when it's needed: 
+        a still-valid token loaded from the pickle save file is reused
+    It's refreshed REFRESH_MARGIN seconds before it expires, 
+        and if several threads need a refresh at once, only one request is made
+    """
     
     URL_TOKEN = "https://accounts.spotify.com/api/token"
     FN_TOKEN = "../data/token.pkl"
 
+    # Refresh this many seconds before the token expires
+    REFRESH_MARGIN = 60
+
     def __init__(self):
 
         # Access env variables
@@ -23,8 +39,20 @@ class Token:
         self.client_secret = os.environ['CLIENT_SECRET']
         self.refresh_token = os.environ['refresh_token']
 
-        # Refresh token
-        self.refresh()
+        # No token yet, so refreshed on first use
+        self._access_token = None
+        self.expires_at = 0.0 # time.time()
+
+        self._init_runtime_state()
+
+    def _init_runtime_state(self) -> None:
+        """ Set up the attributes that aren't pickled """
+
+        # time.monotonic() by which to refresh, derived from the (wall clock) expiry time
+        self._refresh_at = time.monotonic() + (self.expires_at - time.time()) - self.REFRESH_MARGIN
+
+        # Held while refreshing, so only one refresh is in flight
+        self._lock = threading.Lock()
 
     @property
     def base64_credentials(self) -> str:
@@ -45,7 +73,7 @@ class Token:
         try:
             with open(cls.FN_TOKEN, 'rb') as pf:
                 return pickle.load(pf)
-        except (FileNotFoundError, EOFError):
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, ImportError, AttributeError):
             return cls()
 
     def save(self) -> None:
@@ -53,6 +81,23 @@ class Token:
         with open(self.FN_TOKEN, 'wb') as pf:
             pickle.dump(self, pf)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        # Monotonic time means nothing to another process, and locks cannot be pickled
+        state.pop('_refresh_at', None)
+        state.pop('_lock', None)
+        return state
+
+    def __setstate__(self, state):
+
+        # Tokens saved by older versions hold their expiry as a pendulum datetime
+        if 'expires_in' in state:
+            state['expires_at'] = state.pop('expires_in').timestamp()
+
+        self.__dict__.update(state)
+        self._init_runtime_state()
+
     """
     ** Autorefresh 
     """
@@ -61,11 +106,14 @@ class Token:
     def access_token(self) -> str:
         """ 
         When getting the access_token (i.e. my_instance.access_token) 
-            first check if token has expired.
-        If it has, refresh it
+            first check if token is due to expire.
+        If it is, refresh it (once, however many threads are waiting on it)
         """
         if self.has_expired:
-            self.refresh()
+            with self._lock:
+                # Another thread may have refreshed it while we waited for the lock
+                if self.has_expired:
+                    self.refresh()
         return self._access_token
 
     """
@@ -88,8 +136,10 @@ class Token:
         ------------
         :self._access_token: 
             -> new access_token
-        :self.expires_in: 
+        :self.expires_at: 
             -> time the new token expires
+        :self.refresh_token:
+            -> new refresh_token, if one is given
 
         > Calls <
         ---------
@@ -103,12 +153,14 @@ class Token:
             headers = self._refresh_headers,
             data = self._refresh_data
         )
+        response.raise_for_status()
 
         response_data = response.json()
 
         # Update instance vars
         self._access_token = response_data['access_token']
-        self.expires_in = self.get_expiry_time(response_data['expires_in'])
+        self.refresh_token = response_data.get('refresh_token', self.refresh_token)
+        self.set_expiry_time(response_data['expires_in'])
 
         # Save self to pickle file
         self.save()
@@ -117,15 +169,88 @@ class Token:
     ** Expiry time
     """
 
-    @staticmethod
-    def get_expiry_time(seconds) -> pendulum.datetime:
-        """ Get the time at which the token will expire """
-        return pendulum.now() + pendulum.duration(seconds=seconds)
+    def set_expiry_time(self, seconds: float) -> None:
+        """ Set the time at which the token will expire, and by which to refresh it """
+        self.expires_at = time.time() + seconds
+        self._refresh_at = time.monotonic() + seconds - self.REFRESH_MARGIN
 
     @property
     def has_expired(self) -> bool:
-        """ Returns True if the token has expired, else False """
-        return pendulum.now() > self.expires_in
+        """ Returns True if the token has expired (or is about to), else False """
+        return time.monotonic() >= self._refresh_at
+
+
+def create_session(pool_size: int) -> requests.Session:
+    """
+    Create a requests Session whose connections are kept alive and reused
+
+    > Parameters <
+    --------------
+    :pool_size:
+        the maximum number of connections kept open per host
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    # Responses are decompressed transparently by requests
+    session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+    return session
+
+
+class RateLimiter():
+    """
+    Token bucket that spaces out requests to a target rate
+
+    Holds up to :burst: tokens, refilled at :rate: tokens per second
+    Each request takes a token, waiting for one if the bucket is empty
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        > Parameters <
+        --------------
+        :rate:
+            the target number of requests per second
+        :burst:
+            the number of requests that may be made at once after a quiet period
+        """
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+
+        # Time before which no requests may be made (set when the API throttles us)
+        self._paused_until = 0.0
+
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """ Block until a request may be made """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    # Refill the bucket for the time passed since the last refill
+                    self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+                    self._last_refill = now
+
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """ Stop every caller from making requests for the given number of seconds """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
 
 
 def _base_request(request_func:Callable):
@@ -133,6 +258,8 @@ def _base_request(request_func:Callable):
     Executes the request_func with 
         - URL_MAIN prefix for the request url
         - default headers
+        - the api's rate limit
+        - retries for throttled (429) and transient server error (5xx) responses
     
     > Parameters <
     --------------
@@ -146,8 +273,31 @@ def _base_request(request_func:Callable):
         if not url.startswith(api.URL_MAIN):
             url = f"{api.URL_MAIN}{url}"
 
+        for attempt in range(api.MAX_RETRIES + 1):
+
+            api.rate_limiter.acquire()
+            response = request_func(api, url, *args, headers=api.headers_postauth, **kwargs)
+            api.count('requests')
+
+            throttled = response.status_code == 429
+            if throttled:
+                api.count('throttled')
+            elif response.status_code not in api.RETRY_STATUSES:
+                break
+
+            if attempt == api.MAX_RETRIES:
+                # Out of retries, so hand back the failed response
+                break
+            api.count('retried')
+
+            if throttled:
+                # Hold every request back for as long as we're told to
+                api.rate_limiter.pause(api.retry_after(response, attempt))
+            else:
+                time.sleep(api.backoff(attempt))
+
         # Return response
-        return request_func(api, url, *args, headers=api.headers_postauth, **kwargs)        
+        return response
 
     return wrapper
 
@@ -157,10 +307,150 @@ class SpotApi():
     # Base URL for requests
     URL_MAIN = 'https://api.spotify.com/v1/'
 
-    def __init__(self) -> None:
+    # Default number of pooled connections to the API
+    POOL_SIZE = 10
+
+    # Default target request rate (requests per second) and burst size
+    RATE = 20
+    BURST = 100
+
+    # Retries for throttled and transient server error responses
+    MAX_RETRIES = 5
+    RETRY_STATUSES = (500, 502, 503, 504)
+    BACKOFF_BASE = 0.5 # seconds
+    BACKOFF_MAX = 30 # seconds
+
+    # Instance shared by the rest of the program, see SpotApi.shared()
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self, 
+        pool_size: int = POOL_SIZE, 
+        rate: float = RATE, 
+        burst: int = BURST
+        ) -> None:
+        """
+        > Parameters <
+        --------------
+        :pool_size:
+            the maximum number of connections to the API kept open at once
+        :rate:
+            the target number of requests per second
+        :burst:
+            the number of requests that may be made at once after a quiet period
+        """
         # Get token object required for requests
         self.token = Token.load()
 
+        # Pooled session so connections are reused between requests
+        self.pool_size = pool_size
+        self.session = create_session(pool_size)
+
+        # Schedules requests so we stay under the API's rate limit
+        self.rate_limiter = RateLimiter(rate, burst)
+
+        # Counters for requests made, throttled (429) and retried
+        self.stats = {'requests': 0, 'throttled': 0, 'retried': 0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """
+        ** Alternative Constructor **
+        Return the instance shared across the program, creating it on first use
+        Sharing it means everything draws on the same connection pool
+        """
+        # Threads asking for it at once must still get the same session
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    """
+    ** Scheduling
+    """
+
+    def count(self, stat: str) -> None:
+        """ Increment one of the counters in self.stats """
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def backoff(self, attempt: int) -> float:
+        """ Seconds to wait before retrying a failed request: exponential, with full jitter """
+        return random.uniform(0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt))
+
+    def retry_after(self, response: requests.Response, attempt: int) -> float:
+        """ Seconds to wait before retrying a throttled request, as given by the Retry-After header """
+        try:
+            return float(response.headers['Retry-After'])
+        except (KeyError, ValueError):
+            return self.backoff(attempt)
+
+    """
+    ** Pagination
+    """
+
+    def get_json(self, url: str, **kwargs) -> dict:
+        """ 
+        Perform get request for given url and **kwargs
+        Return dict by using json() method on response object
+
+        Raises requests.HTTPError if the request still failed after retries
+        """
+        response = self.get(url, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def paginate(
+        self, 
+        url: str, 
+        params: dict | None = None, 
+        first_page: dict | None = None,
+        max_workers: int | None = None
+        ) -> list:
+        """
+        Get every item of a paged endpoint
+
+        The first page gives the total number of items and the page size, 
+            so the offsets of the remaining pages are known up front
+            and they're fetched concurrently, then put back in order
+
+        > Parameters <
+        --------------
+        :url:
+            the url of the paged endpoint
+        :params:
+            params for every page request (e.g. limit)
+        :first_page:
+            the first page's paging object, if it's already been fetched
+        :max_workers:
+            the maximum number of pages fetched at once
+            DEFAULT: None
+                -> the size of the connection pool
+        """
+        params = params or dict()
+        if first_page is None:
+            first_page = self.get_json(url, params=params)
+
+        items = list(first_page['items'])
+
+        # Offsets of the pages after the first one
+        limit = first_page['limit']
+        offsets = range(first_page['offset'] + limit, first_page['total'], limit)
+        if not offsets:
+            return items
+
+        def get_page(offset: int) -> list:
+            return self.get_json(url, params=params | {'offset': offset, 'limit': limit})['items']
+
+        # map returns the pages in the order of their offsets
+        with ThreadPoolExecutor(max_workers or self.pool_size) as executor:
+            for page_items in executor.map(get_page, offsets):
+                items.extend(page_items)
+
+        return items
+
     @property
     def headers_postauth(self) -> dict:
         """ Headers used for all subsequent requests after initial authorisation """
@@ -168,22 +458,99 @@ class SpotApi():
 
     @_base_request
     def request(self, url:str, method:str, *args, **kwargs) -> requests.Response:
-        return requests.request(url, method, *args, **kwargs)
+        return self.session.request(method, url, *args, **kwargs)
 
     @_base_request
     def get(self, url:str, *args, **kwargs) -> requests.Response:
-        return requests.get(url, *args, **kwargs)
+        return self.session.get(url, *args, **kwargs)
 
     @_base_request
     def post(self, url:str, *args, **kwargs) -> requests.Response:
-        return requests.post(url, *args, **kwargs)
+        return self.session.post(url, *args, **kwargs)
     
     @_base_request
     def put(self, url:str, *args, **kwargs) -> requests.Response:
-        return requests.put(url, *args, **kwargs)
+        return self.session.put(url, *args, **kwargs)
 
     @_base_request
     def delete(self, url:str, *args, **kwargs) -> requests.Response:
-        return requests.delete(url, *args, **kwargs)
-    
+        return self.session.delete(url, *args, **kwargs)
+
+
+class AsyncSpotApi():
+    """
+    asyncio interface to SpotApi
+
+    Mirrors SpotApi's request methods, which run in worker threads 
+        so they keep _base_request's rate limiting, retries and token handling
+        and share the SpotApi's connection pool
+    At most :max_concurrent: requests are in flight at once
+    """
+
+    def __init__(self, spotapi: SpotApi | None = None, max_concurrent: int | None = None) -> None:
+        """
+        > Parameters <
+        --------------
+        :spotapi:
+            the SpotApi to make requests with
+            DEFAULT: None
+                -> uses the shared SpotApi
+        :max_concurrent:
+            the maximum number of requests in flight at once
+            DEFAULT: None
+                -> the size of the SpotApi's connection pool
+        """
+        self.spotapi = spotapi or SpotApi.shared()
+        self.semaphore = asyncio.Semaphore(max_concurrent or self.spotapi.pool_size)
+
+    async def _run(self, request_func: Callable, *args, **kwargs) -> requests.Response:
+        """ Run a blocking SpotApi request in a worker thread, within the concurrency limit """
+        async with self.semaphore:
+            return await asyncio.to_thread(request_func, *args, **kwargs)
+
+    async def request(self, url:str, method:str, *args, **kwargs) -> requests.Response:
+        return await self._run(self.spotapi.request, url, method, *args, **kwargs)
+
+    async def get(self, url:str, *args, **kwargs) -> requests.Response:
+        return await self._run(self.spotapi.get, url, *args, **kwargs)
+
+    async def post(self, url:str, *args, **kwargs) -> requests.Response:
+        return await self._run(self.spotapi.post, url, *args, **kwargs)
+
+    async def put(self, url:str, *args, **kwargs) -> requests.Response:
+        return await self._run(self.spotapi.put, url, *args, **kwargs)
+
+    async def delete(self, url:str, *args, **kwargs) -> requests.Response:
+        return await self._run(self.spotapi.delete, url, *args, **kwargs)
+
+    """
+    ** Pagination
+    """
+
+    async def get_json(self, url: str, **kwargs) -> dict:
+        """ See SpotApi.get_json """
+        return await self._run(self.spotapi.get_json, url, **kwargs)
+
+    async def paginate(self, url: str, params: dict | None = None, first_page: dict | None = None) -> list:
+        """ 
+        See SpotApi.paginate
+        The remaining pages are gathered concurrently, within the concurrency limit
+        """
+        params = params or dict()
+        if first_page is None:
+            first_page = await self.get_json(url, params=params)
+
+        items = list(first_page['items'])
+
+        # Offsets of the pages after the first one
+        limit = first_page['limit']
+        offsets = range(first_page['offset'] + limit, first_page['total'], limit)
+
+        # gather returns the pages in the order of their offsets
+        pages = await asyncio.gather(
+            *(self.get_json(url, params=params | {'offset': i, 'limit': limit}) for i in offsets)
+        )
+        [items.extend(i['items']) for i in pages]
+
+        return items
 
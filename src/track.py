@@ -5,27 +5,65 @@
 
 from dataclasses import dataclass
 from typing import List, Callable
-import copy
+import inspect
+import sys
 
 
-@dataclass
+# Shared artist records: every track by an artist refers to the same (id, name) tuple
+_artists = dict()
+
+
+def _intern(string: str | None) -> str | None:
+    return sys.intern(string) if string is not None else None
+
+
+def _intern_artists(artists) -> tuple[tuple[str, str], ...]:
+    """ Return artists as a tuple of the shared (id, name) records """
+    return tuple(
+        _artists.setdefault(artist, artist) for artist in 
+        ((_intern(id_), _intern(name)) for id_, name in artists)
+    )
+
+
+@dataclass(frozen=True, slots=True, eq=False)
 class Track():
-    """ Custom class for Spotify track """
+    """ 
+    Custom class for Spotify track 
+
+    Immutable and slotted (no per-instance __dict__) to keep large queues compact
+    Artists are stored as shared, interned (id, name) records
+    """
     id_: str # track_id
     name: str # track_name
-    artists: List[tuple[str, str]] # [(artist1_id, artist1_name), (artist2_id, artist2_name), ...]
+    artists: tuple[tuple[str, str], ...] # ((artist1_id, artist1_name), (artist2_id, artist2_name), ...)
     preview_url: str 
 
     URI_PREFIX = "spotify:track:"
 
+    def __post_init__(self):
+        object.__setattr__(self, 'artists', _intern_artists(self.artists))
+
+    def __getstate__(self):
+        return (self.id_, self.name, self.artists, self.preview_url)
+
+    def __setstate__(self, state):
+
+        # Tracks pickled before Track was slotted hold their fields in a dict
+        if isinstance(state, dict):
+            state = (state['id_'], state['name'], state['artists'], state['preview_url'])
+
+        id_, name, artists, preview_url = state
+        object.__setattr__(self, 'id_', id_)
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'artists', _intern_artists(artists))
+        object.__setattr__(self, 'preview_url', preview_url)
+
     def __str__(self):
  
-        artists = copy.copy(self.artists)
-        artist_str = artists.pop()[1]
+        *secondary_artists, (_, artist_str) = self.artists
 
-        if artists:
-            secondary_artists = '; '.join(i[1] for i in artists)
-            artist_str += f" (feat. {secondary_artists})"
+        if secondary_artists:
+            artist_str += f" (feat. {'; '.join(i[1] for i in secondary_artists)})"
 
         # Example:
         # Death Grips (feat. Meg Myers; Madonna; Britney Spears)
@@ -73,12 +111,10 @@ def _convert_to_track_object(track:dict) -> Track:
 
 def convert_to_track_object_dec(func:Callable) -> Track:
     """
-    Decorator that executes a function and 
+    Decorator that executes a function (or coroutine function) and 
         converts the result of that function to a Track object
     """
-    def inner(self, *args, **kwargs):
-        result = func(self, *args, **kwargs)
-
+    def convert(result):
         if not result:
             return None
 
@@ -87,6 +123,14 @@ def convert_to_track_object_dec(func:Callable) -> Track:
         elif isinstance(result, list):               
             return [_convert_to_track_object(i) for i in result if i]
 
+    if inspect.iscoroutinefunction(func):
+        async def inner_async(self, *args, **kwargs):
+            return convert(await func(self, *args, **kwargs))
+        return inner_async
+
+    def inner(self, *args, **kwargs):
+        return convert(func(self, *args, **kwargs))
+
     return inner
 
 
@@ -0,0 +1,292 @@
+"""
+    Compact, columnar on-disk format for lists of tracks
+        Used to save queues, so that large queues open instantly
+        and only the tracks actually used are decoded
+
+    > File layout <
+    ---------------
+    MAGIC
+    blocks: each column of each block of BLOCK_SIZE tracks, zlib-compressed JSON
+    footer: JSON of the number of tracks, the block size, and where each column's blocks are
+    footer length (8 bytes, little-endian)
+
+    Tracks are added by writing their blocks and a new footer after the old one (see TrackColumns.append)
+        so the file read up to its old size is unchanged, and the old footer is left as is
+"""
+
+# Local
+from track import Track
+
+# Other
+from collections import OrderedDict
+from collections.abc import Sequence
+import itertools
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import Iterable
+import zlib
+
+
+MAGIC = b'LLTRACKS1\n'
+
+# Number of tracks per block
+BLOCK_SIZE = 1024
+
+# Columns, in the order of Track's fields
+COLUMNS = ('id_', 'name', 'artists', 'preview_url')
+
+_FOOTER_LENGTH = struct.Struct('<Q')
+
+
+def _row(track: Track) -> tuple:
+    """ The values of a track, in the order of COLUMNS """
+    return (track.id_, track.name, track.artists, track.preview_url)
+
+
+def _write_blocks(f, rows: Iterable[tuple], columns: dict, block_size: int) -> int:
+    """
+    Write rows to f in blocks of block_size, adding where each column of each block is to columns
+    Returns the number of rows written
+    """
+    rows = iter(rows)
+    count = 0
+    while (block := tuple(itertools.islice(rows, block_size))):
+        for column, values in zip(COLUMNS, zip(*block)):
+            data = zlib.compress(json.dumps(values, separators=(',', ':')).encode())
+            columns[column].append([f.tell(), len(data)])
+            f.write(data)
+        count += len(block)
+    return count
+
+
+def _write_footer(f, count: int, block_size: int, columns: dict) -> None:
+    footer = json.dumps({'count': count, 'block_size': block_size, 'columns': columns}).encode()
+    f.write(footer)
+    f.write(_FOOTER_LENGTH.pack(len(footer)))
+
+
+class _MappedFile():
+    """ A track columns file, memory-mapped, with a small cache of decoded blocks """
+
+    # Number of decoded blocks kept in memory
+    CACHED_BLOCKS = 8
+
+    def __init__(self, file_path: str, size: int | None = None) -> None:
+        self.file_path = file_path
+
+        with open(file_path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a track columns file: {file_path}")
+
+        # Anything past size was written by an append whose size wasn't saved, so is ignored
+        self.size = size if size is not None else len(self.mmap)
+        footer_end = self.size - _FOOTER_LENGTH.size
+        (footer_length,) = _FOOTER_LENGTH.unpack(self.mmap[footer_end:self.size])
+        footer = json.loads(self.mmap[footer_end - footer_length:footer_end])
+
+        self.count = footer['count']
+        self.block_size = footer['block_size']
+        self.columns = footer['columns']
+
+        # {block number: list of Tracks}, least recently used first
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def track(self, i: int) -> Track:
+        """ The i-th track, decoding its block if it isn't cached """
+        block, offset = divmod(i, self.block_size)
+
+        with self._lock:
+            if block in self._blocks:
+                self._blocks.move_to_end(block)
+                return self._blocks[block][offset]
+
+        tracks = self._decode_block(block)
+
+        with self._lock:
+            self._blocks[block] = tracks
+            if len(self._blocks) > self.CACHED_BLOCKS:
+                self._blocks.popitem(last=False)
+        return tracks[offset]
+
+    def _decode_block(self, block: int) -> list:
+        columns = list()
+        for column in COLUMNS:
+            start, length = self.columns[column][block]
+            columns.append(json.loads(zlib.decompress(self.mmap[start:start+length])))
+        return [Track(*i) for i in zip(*columns)]
+
+    def close(self) -> None:
+        self.mmap.close()
+
+
+class TrackColumns(Sequence):
+    """
+    Read-only sequence of the tracks in a track columns file
+
+    Tracks are decoded a block at a time, only when they're accessed
+    Slicing returns another TrackColumns over the same file, without decoding anything
+    """
+
+    def __init__(
+            self, file_path: str, size: int | None = None,
+            _file: _MappedFile | None = None, _indices: range | None = None
+        ) -> None:
+        """
+        > Parameters <
+        --------------
+        :file_path:
+            the path of the track columns file
+        :size:
+            the size of the file when it was saved (see self.size), or None to read all of it
+        """
+        self._file = _file or _MappedFile(file_path, size)
+        self._indices = _indices if _indices is not None else range(self._file.count)
+
+    @property
+    def file_path(self) -> str:
+        return self._file.file_path
+
+    @property
+    def size(self) -> int:
+        """ The number of bytes of the file in use, to open it with after it's been appended to """
+        return self._file.size
+
+    @property
+    def is_whole_file(self) -> bool:
+        """ Returns True if this covers every track in the file, in order """
+        return self._indices == range(self._file.count)
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return TrackColumns(self.file_path, _file=self._file, _indices=self._indices[i])
+        return self._file.track(self._indices[i])
+
+    def __iter__(self):
+        return (self._file.track(i) for i in self._indices)
+
+    def close(self) -> None:
+        """ Unmap the file (this closes every TrackColumns sliced from the same file) """
+        self._file.close()
+
+    @classmethod
+    def write(cls, file_path: str, tracks: Iterable[Track]):
+        """
+        ** Alternative Constructor **
+        Write tracks to a track columns file, then open it
+
+        The file is written to a temporary file first and then replaces file_path,
+            so tracks can come from a TrackColumns over file_path itself
+        """
+        temp_path = f"{file_path}.tmp"
+        columns = {i: list() for i in COLUMNS}
+
+        with open(temp_path, 'wb') as f:
+            f.write(MAGIC)
+            count = _write_blocks(f, (_row(i) for i in tracks), columns, BLOCK_SIZE)
+            _write_footer(f, count, BLOCK_SIZE, columns)
+
+        # The file can't be replaced while it's mapped (on Windows)
+        mapped = tracks.saved if isinstance(tracks, AppendedTracks) else tracks
+        if isinstance(mapped, TrackColumns) and os.path.abspath(mapped.file_path) == os.path.abspath(file_path):
+            mapped.close()
+
+        os.replace(temp_path, file_path)
+        return cls(file_path)
+
+    def append(self, tracks: Iterable[Track]):
+        """
+        Write tracks to the end of the file, then open it again (this must cover the whole file)
+        This closes the file, as write() does, so returns the TrackColumns to use from then on
+
+        Only the new tracks are encoded, with those of the last block if it isn't full,
+            so this takes time in proportion to them, however many tracks the file has
+        Nothing already in the file is changed: opened at its old size, it holds the same tracks as before
+            So the new size must be saved, and the file opened with it (see self.size)
+        """
+        if not self.is_whole_file:
+            raise ValueError(f"Can only append to a whole track columns file: {self.file_path}")
+
+        file = self._file
+        file_path, size, block_size = file.file_path, file.size, file.block_size
+        columns = {k: list(v) for k, v in file.columns.items()}
+
+        # The tracks of the last block, if it isn't full, are written again with the new ones
+        # so every block stays full but the last
+        last, partial = divmod(file.count, block_size)
+        rows = list()
+        if partial:
+            rows = [_row(i) for i in file._decode_block(last)]
+            for blocks in columns.values():
+                del blocks[last:]
+
+        # The file can't be written to while it's mapped (on Windows)
+        self.close()
+
+        with open(file_path, 'r+b') as f:
+            # Drop anything written after size by an append that wasn't saved
+            f.truncate(size)
+            f.seek(size)
+            count = last * block_size + _write_blocks(f, itertools.chain(rows, (_row(i) for i in tracks)), columns, block_size)
+            _write_footer(f, count, block_size, columns)
+            size = f.tell()
+
+        return TrackColumns(file_path, size)
+
+
+class AppendedTracks(Sequence):
+    """
+    Read-only sequence of saved tracks (e.g. a TrackColumns) followed by tracks added since, kept in memory
+
+    Adding tracks only extends the list of those added, so doesn't decode or copy the saved tracks
+    They're written to the end of the saved file on the next save (see TrackColumns.append)
+    """
+
+    def __init__(self, saved: Sequence[Track] = (), appended: list[Track] | None = None) -> None:
+        """
+        > Parameters <
+        --------------
+        :saved:
+            the tracks already saved
+        :appended:
+            the tracks added since
+        """
+        self.saved = saved
+        self.appended = appended if appended is not None else list()
+
+    def extend(self, tracks: Iterable[Track]) -> None:
+        """ Add tracks to the end (tracks before them keep their indices) """
+        self.appended.extend(tracks)
+
+    def __len__(self) -> int:
+        return len(self.saved) + len(self.appended)
+
+    def __getitem__(self, i):
+        saved = len(self.saved)
+
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            # Sliced lazily, so the saved tracks aren't decoded
+            return AppendedTracks(
+                self.saved[start:max(start, min(stop, saved))],
+                self.appended[max(start - saved, 0):max(stop - saved, 0)]
+            )
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("track index out of range")
+        return self.saved[i] if i < saved else self.appended[i - saved]
+
+    def __iter__(self):
+        return itertools.chain(self.saved, self.appended)
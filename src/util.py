@@ -36,8 +36,9 @@ def file_last_modified_today(file_path: str) -> bool:
     current_time = time.time()
 
     # Convert the modification time and current time to dates
-    modification_date = time.gmtime(modification_time).tm_yday
-    current_date = time.gmtime(current_time).tm_yday
+    # (year, month and day, so the same day of a different month or year doesn't match)
+    modification_date = time.gmtime(modification_time)[:3]
+    current_date = time.gmtime(current_time)[:3]
 
     # Return True if the modification date is the same as the current date, else False
     return modification_date == current_date
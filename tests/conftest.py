@@ -0,0 +1,33 @@
+# The modules import each other by name, as when the program is run from src
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+
+
+@pytest.fixture
+def make_tracks():
+    """ Returns a function making n tracks, numbered from start, by 5 artists (every 7th without a preview) """
+    from track import Track
+
+    def make_tracks(n: int, start: int = 0) -> list:
+        return [
+            Track(f't{i}', f'track {i}', [(f'a{i % 5}', f'artist {i % 5}')], f'https://p/{i}' if i % 7 else None)
+            for i in range(start, start + n)
+        ]
+    return make_tracks
+
+
+@pytest.fixture
+def queue_dir(tmp_path, monkeypatch):
+    """ Saves queues and listening histories to a temporary directory, read afresh from disk by each load """
+    from history import ListeningHistory
+    from main import PreviewQueue
+
+    monkeypatch.setattr(PreviewQueue, 'save_file_location', str(tmp_path))
+    monkeypatch.setattr(PreviewQueue, 'FN_LISTENED_TRACKS', str(tmp_path / 'listened_tracks'))
+    monkeypatch.setattr(PreviewQueue, 'FN_LISTENED_ARTISTS', str(tmp_path / 'listened_artists'))
+    monkeypatch.setattr(ListeningHistory, '_loaded', dict())
+    return tmp_path
@@ -0,0 +1,118 @@
+from everynoise import GenreIndex, NewReleases, stream_tracks
+
+import pytest
+
+
+def row(track_id: str, artist: str, name: str) -> str:
+    return (
+        f'<tr><td><input type=checkbox name=t value="spotify:track:{track_id}"></td>'
+        f'<td><span class="play trackcount" trackid="spotify:track:{track_id}" preview_url="https://p/{track_id}">&#9654;</span></td>'
+        f'<td><a href="spotify:artist:a{track_id}">{artist}</a></td>'
+        f'<td><a href="spotify:album:{track_id}">{name}</a></td></tr>\n'
+    )
+
+
+def page(*rows: str) -> bytes:
+    # No <meta charset>, as on everynoise.com
+    return f"<html><body><table>{''.join(rows)}</table></body></html>".encode('utf-8')
+
+
+def chunked(data: bytes, size: int):
+    return (data[i:i+size] for i in range(0, len(data), size))
+
+
+def test_utf8_names():
+    html = page(row('t1', 'Beyoncé', 'Café Ñandú'), row('t2', 'Sigur Rós', 'Hoppípolla'))
+    tracks = [track for track, _ in stream_tracks([html])]
+
+    assert [(i.artists[0][1], i.name) for i in tracks] == [('Beyoncé', 'Café Ñandú'), ('Sigur Rós', 'Hoppípolla')]
+
+
+def test_multibyte_characters_split_across_chunks():
+    html = page(*(row(f't{i}', 'Beyoncé', 'Ünïcödé') for i in range(20)))
+    tracks = [track for track, _ in stream_tracks(chunked(html, 7))]
+
+    assert len(tracks) == 20
+    assert all(i.artists[0][1] == 'Beyoncé' and i.name == 'Ünïcödé' for i in tracks)
+
+
+def test_encoding_given():
+    html = f"<html><body><table>{row('t1', 'Beyoncé', 'Déjà Vu')}</table></body></html>".encode('iso-8859-1')
+    [(track, _)] = stream_tracks([html], 'iso-8859-1')
+
+    assert track.artists == (('at1', 'Beyoncé'),) and track.name == 'Déjà Vu'
+
+
+def test_fields_and_similar_rows():
+    html = page(
+        row('t1', 'A', 'One'),
+        '<tr class="similargenres"><td colspan=5>similar genres</td></tr>\n',
+        row('t2', 'B', 'Two'),
+    )
+    results = list(stream_tracks(chunked(html, 64)))
+
+    assert [(i.id_, i.preview_url, is_similar) for i, is_similar in results] == [
+        ('t1', 'https://p/t1', False),
+        ('t2', 'https://p/t2', True),
+    ]
+
+
+@pytest.fixture
+def genre_index():
+    return GenreIndex(['pop', 'k-pop', 'indie pop', 'Pop Punk', 'pop rock', 'punk', 'rock', 'rock', 'anygenre'])
+
+
+def test_genre_index_exact(genre_index):
+    assert 'pop' in genre_index and 'Pop Punk' in genre_index
+    assert 'pop punk' not in genre_index and 'po' not in genre_index
+    assert len(genre_index) == 8
+
+
+def test_genre_index_prefix(genre_index):
+    # Case-insensitive, in alphabetical order
+    assert genre_index.starting_with('pop') == ['pop', 'Pop Punk', 'pop rock']
+    assert genre_index.starting_with('POP R') == ['pop rock']
+    assert genre_index.starting_with('pop', n=2) == ['pop', 'Pop Punk']
+    assert genre_index.starting_with('zzz') == []
+
+
+def test_genre_index_suggest(genre_index):
+    # Genres beginning with the text come first
+    assert genre_index.suggest('pop', n=3) == ['pop', 'Pop Punk', 'pop rock']
+
+    # Then the closest by trigrams, e.g. for a typo
+    assert genre_index.suggest('rokc')[0] == 'rock'
+    assert genre_index.suggest('indy pop')[0] == 'indie pop'
+    assert len(genre_index.suggest('p', n=2)) == 2
+    assert genre_index.suggest('xyzzy') == []
+
+
+class Options(dict):
+    """ Stands in for SearchOptions, which are scraped from everynoise.com """
+    genre_index = GenreIndex(['pop'])
+
+
+def test_partition_reads_page_once(monkeypatch):
+    html = page(
+        row('t1', 'A', 'One'),
+        '<tr class="similargenres"><td colspan=5>similar genres</td></tr>\n',
+        row('t2', 'B', 'Two'),
+    )
+    reads = list()
+
+    def iter_tracks(self):
+        reads.append(self.genre)
+        return stream_tracks([html])
+
+    monkeypatch.setattr(NewReleases, 'iter_tracks', iter_tracks)
+    new_releases = NewReleases('pop', search_options=Options(region=['US'], date=[]))
+    new_releases.show_progress = False
+
+    assert [i.id_ for i in new_releases.tracks] == ['t1']
+    assert [i.id_ for i in new_releases.tracks_and_similar] == ['t1', 't2']
+    assert len(new_releases) == 1
+    assert reads == ['pop']
+
+    # Callers get their own lists, so can't change the memoized ones
+    new_releases.tracks.clear()
+    assert len(new_releases) == 1
@@ -0,0 +1,52 @@
+from filters import FilterMasks, HasPreviewUrl, NewTracks, UniqueArtists, UniqueTracks
+from track import Track
+
+
+def make_tracks():
+    return [
+        Track('t1', 'listened', [('A', 'Artist A')], 'url1'),
+        Track('t2', 'new', [('A', 'Artist A')], 'url2'),
+        Track('t3', 'other', [('B', 'Artist B')], 'url3'),
+    ]
+
+
+def test_unique_after_new_only_sees_new_tracks():
+    # t1 is listened to, so dropped by new tracks: it mustn't hide t2, a new track by the same artist
+    tracks = make_tracks()
+    masks = FilterMasks(HasPreviewUrl())
+
+    assert masks.select([NewTracks({'t1'}), UniqueArtists()], tracks) == [1, 2]
+    assert masks.stats['new tracks']['dropped'] == 1
+    assert masks.stats['unique artists']['dropped'] == 0
+
+
+def test_unique_masks_kept_per_combination():
+    tracks = make_tracks()
+    masks = FilterMasks(HasPreviewUrl())
+    new = NewTracks({'t1'})
+
+    # Alone, unique artists sees t1 first, so drops t2
+    assert masks.select([UniqueArtists()], tracks) == [0, 2]
+    assert masks.select([new, UniqueArtists()], tracks) == [1, 2]
+    assert masks.select([UniqueArtists()], tracks) == [0, 2]
+
+
+def test_unique_after_new_when_tracks_are_added():
+    tracks = make_tracks()
+    masks = FilterMasks(HasPreviewUrl())
+    filters = [NewTracks({'t1', 't4'}), UniqueArtists()]
+
+    assert masks.select(filters, tracks[:1]) == []
+    assert masks.select(filters, tracks, 1) == [1, 2]
+
+    # A listened track and a duplicate artist
+    tracks += [Track('t4', 'listened', [('C', 'Artist C')], 'url4'), Track('t5', 'new', [('B', 'Artist B')], 'url5')]
+    assert masks.select(filters, tracks, 3) == []
+
+
+def test_base_filter_drops_tracks_before_unique():
+    # A track without a preview can't be played, so mustn't hide a later track as a duplicate
+    tracks = [Track('t1', 'no preview', [('A', 'Artist A')], None), Track('t1', 'preview', [('A', 'Artist A')], 'url')]
+    masks = FilterMasks(HasPreviewUrl())
+
+    assert masks.select([UniqueTracks()], tracks) == [1]
@@ -0,0 +1,51 @@
+from journal import Journal
+
+
+def test_append_and_replay(tmp_path):
+    journal = Journal(str(tmp_path / 'q'))
+    journal.append(['played', 't1', ['a1']], ['cursor', 1])
+    journal.append(['liked', 'spotify:track:t1'])
+
+    assert len(journal) == 3
+    assert list(journal.replay()) == [['played', 't1', ['a1']], ['cursor', 1], ['liked', 'spotify:track:t1']]
+
+    # Replayed from the file, e.g. by the next run
+    journal.close()
+    assert list(Journal(str(tmp_path / 'q')).replay()) == list(journal.replay())
+
+
+def test_replay_without_file(tmp_path):
+    assert list(Journal(str(tmp_path / 'q')).replay()) == []
+
+
+def test_event_cut_short(tmp_path):
+    journal = Journal(str(tmp_path / 'q'))
+    journal.append(['cursor', 1])
+    journal.close()
+
+    # The program was killed part way through writing an event
+    with open(journal.file_path, 'a', encoding='utf-8') as f:
+        f.write('["cursor", 2')
+
+    journal = Journal(str(tmp_path / 'q'))
+    assert list(journal.replay()) == [['cursor', 1]]
+
+    # The next event starts on a new line, so isn't lost with it
+    journal.append(['cursor', 3])
+    assert list(journal.replay()) == [['cursor', 1], ['cursor', 3]]
+
+
+def test_compact(tmp_path):
+    journal = Journal(str(tmp_path / 'q'))
+    journal.append(['cursor', 1], ['cursor', 2])
+
+    saved = list()
+    journal.compact(lambda: saved.append(list(journal.replay())))
+
+    # Saved with every event, then cleared
+    assert saved == [[['cursor', 1], ['cursor', 2]]]
+    assert list(journal.replay()) == []
+    assert len(journal) == 0
+
+    journal.append(['cursor', 3])
+    assert list(journal.replay()) == [['cursor', 3]]
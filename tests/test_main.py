@@ -0,0 +1,123 @@
+from history import ListeningHistory
+from main import PreviewQueue, Settings
+from playlist_updater import PlaylistWriter
+
+import pickle
+import pytest
+import requests
+
+
+class UnreachablePlaylist():
+    """ Stands in for PlaylistUpdater: every request fails, so liked tracks stay pending """
+
+    track_ids = set()
+
+    def contains(self, track_uri: str) -> bool:
+        return False
+
+    def tracks_to_playlist(self, track_uris: list) -> None:
+        raise requests.ConnectionError('offline')
+
+
+@pytest.fixture
+def queue(queue_dir, make_tracks):
+    """ A saved queue of 20 tracks (built without __init__, which asks for settings) """
+    queue = object.__new__(PreviewQueue)
+    queue.name = 'q'
+    queue.reset()
+    queue.open_journal()
+    queue.save_enabled = True
+    queue.unsent_likes = list()
+    queue.playlist_writer = None
+    queue.settings = Settings()
+
+    queue.append(make_tracks(20))
+    queue.queue_save()
+    yield queue
+    queue.journal.close()
+
+
+def play(queue: PreviewQueue) -> None:
+    """ Play the next track, as preview_tracks does """
+    track = queue.queue[queue.cursor]
+    queue.listened_artists.update(track.artist_ids)
+    queue.listened_tracks.update([track.id_])
+    queue.cursor += 1
+    queue.journal.append(['played', track.id_, track.artist_ids], ['cursor', queue.cursor])
+
+
+def kill_and_load(queue: PreviewQueue, monkeypatch) -> PreviewQueue:
+    """ Load the queue as the next run would if the program were killed now (nothing flushed at exit) """
+    queue.journal.close()
+    monkeypatch.setattr(ListeningHistory, '_loaded', dict())
+    with open(queue.file_path, 'rb') as pf:
+        loaded = pickle.load(pf)
+    loaded.replay_journal()
+    return loaded
+
+
+def test_played_survives_compaction(queue, monkeypatch):
+    played = queue.queue[0]
+    play(queue)
+    queue.queue_save()
+    assert list(queue.journal.replay()) == []
+
+    loaded = kill_and_load(queue, monkeypatch)
+    assert loaded.cursor == 1
+    assert played.id_ in loaded.listened_tracks
+    assert all(i in loaded.listened_artists for i in played.artist_ids)
+
+
+def test_events_after_compaction_replayed(queue, monkeypatch):
+    first, second = queue.queue[0], queue.queue[1]
+    play(queue)
+    queue.queue_save()
+    play(queue)
+
+    loaded = kill_and_load(queue, monkeypatch)
+    assert loaded.cursor == 2
+    assert first.id_ in loaded.listened_tracks and second.id_ in loaded.listened_tracks
+
+    # Replaying saves the queue with the events, then compacts the journal
+    assert list(loaded.journal.replay()) == []
+    loaded.journal.close()
+
+
+def test_unsent_likes_survive_compaction(queue, monkeypatch):
+    liked = queue.queue[0].uri
+    queue.playlist_writer = PlaylistWriter(UnreachablePlaylist())
+    assert queue.playlist_writer.add(liked)
+    queue.journal.append(['liked', liked])
+    queue.queue_save()
+    assert list(queue.journal.replay()) == []
+
+    loaded = kill_and_load(queue, monkeypatch)
+    assert loaded.unsent_likes == [liked]
+    assert loaded.playlist_writer is None
+
+
+def test_cursor_saved_and_loaded(queue, monkeypatch):
+    for _ in range(3):
+        play(queue)
+    remaining = [i.id_ for i in queue.remaining]
+    queue.queue_save()
+
+    loaded = kill_and_load(queue, monkeypatch)
+    assert loaded.cursor == 3
+    assert len(loaded) == len(remaining)
+    assert [i.id_ for i in loaded.remaining] == remaining
+    loaded.journal.close()
+
+
+def test_played_tracks_stay_out_when_refiltered(queue):
+    played = [queue.queue[0].id_, queue.queue[1].id_]
+    play(queue)
+    play(queue)
+
+    # Not filtered by the listening history either, so only self.played keeps them out
+    queue.settings.new = None
+    queue.settings.unique = None
+    queue.filter()
+
+    assert queue.cursor == 0
+    assert not set(played) & {i.id_ for i in queue.remaining}
@@ -0,0 +1,48 @@
+from spotapi import Token
+
+from datetime import datetime, timedelta, timezone
+import pickle
+import time
+
+
+def legacy_state(expires_in: float) -> dict:
+    """ The state of a token pickled by older versions, which held its expiry as a (pendulum) datetime """
+    return {
+        'client_id': 'id',
+        'client_secret': 'secret',
+        'refresh_token': 'refresh',
+        '_access_token': 'access',
+        'expires_in': datetime.now(timezone.utc) + timedelta(seconds=expires_in),
+    }
+
+
+def unpickle(state: dict) -> Token:
+    token = Token.__new__(Token)
+    token.__setstate__(state)
+    return token
+
+
+def test_legacy_expiry_migrated():
+    token = unpickle(legacy_state(600))
+
+    assert 'expires_in' not in token.__dict__
+    assert abs(token.expires_at - (time.time() + 600)) < 5
+    assert not token.has_expired
+    assert token.access_token == 'access'
+
+
+def test_legacy_token_refreshed_before_expiry():
+    # Within REFRESH_MARGIN of expiring, so it's due a refresh
+    assert unpickle(legacy_state(Token.REFRESH_MARGIN / 2)).has_expired
+    assert unpickle(legacy_state(-10)).has_expired
+
+
+def test_pickle_round_trip():
+    token = unpickle(legacy_state(600))
+    state = token.__getstate__()
+    assert '_lock' not in state and '_refresh_at' not in state
+
+    loaded = pickle.loads(pickle.dumps(token))
+    assert loaded.expires_at == token.expires_at
+    assert not loaded.has_expired
+    assert loaded._lock is not token._lock
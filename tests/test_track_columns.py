@@ -0,0 +1,117 @@
+from track_columns import BLOCK_SIZE, AppendedTracks, TrackColumns
+
+import pytest
+
+
+def ids(tracks) -> list:
+    return [i.id_ for i in tracks]
+
+
+@pytest.fixture
+def saved(tmp_path, make_tracks):
+    """ A file of a block and a half of tracks, so its last block is partial """
+    tracks = TrackColumns.write(str(tmp_path / 'q.tracks'), make_tracks(BLOCK_SIZE + BLOCK_SIZE // 2))
+    yield tracks
+    tracks.close()
+
+
+def test_write_and_read(saved, make_tracks):
+    expected = make_tracks(BLOCK_SIZE + BLOCK_SIZE // 2)
+    assert len(saved) == len(expected)
+    assert ids(saved) == ids(expected)
+    assert saved[-1].artists == expected[-1].artists and saved[-1].preview_url == expected[-1].preview_url
+    assert ids(saved[BLOCK_SIZE - 2:BLOCK_SIZE + 2]) == ids(expected[BLOCK_SIZE - 2:BLOCK_SIZE + 2])
+
+
+def test_append_fills_partial_block(saved, make_tracks):
+    count, file_path = len(saved), saved.file_path
+    appended = saved.append(make_tracks(BLOCK_SIZE, count))
+
+    assert ids(appended) == ids(make_tracks(count + BLOCK_SIZE))
+
+    # Every block is full but the last
+    blocks = -(-len(appended) // BLOCK_SIZE)
+    assert all(len(i) == blocks for i in appended._file.columns.values())
+
+    # Reopened at the size it was saved at
+    reopened = TrackColumns(file_path, appended.size)
+    assert ids(reopened) == ids(appended)
+    reopened.close()
+    appended.close()
+
+
+def test_reopen_at_old_size(saved, make_tracks):
+    count, size, file_path = len(saved), saved.size, saved.file_path
+    saved.append(make_tracks(10, count)).close()
+
+    # The append's size was never saved (e.g. the program was killed), so its tracks are ignored
+    reopened = TrackColumns(file_path, size)
+    assert ids(reopened) == ids(make_tracks(count))
+    reopened.close()
+
+
+def test_append_drops_stale_tail(saved, make_tracks):
+    count, size, file_path = len(saved), saved.size, saved.file_path
+    saved.append(make_tracks(10, 10_000)).close()
+
+    # Appending to the file opened at its saved size writes over the unsaved tracks
+    appended = TrackColumns(file_path, size).append(make_tracks(5, count))
+    assert ids(appended) == ids(make_tracks(count + 5))
+
+    reopened = TrackColumns(file_path)
+    assert ids(reopened) == ids(appended)
+    reopened.close()
+    appended.close()
+
+
+def test_append_to_slice(saved, make_tracks):
+    with pytest.raises(ValueError):
+        saved[1:].append(make_tracks(1))
+
+
+@pytest.fixture
+def tracks(saved, make_tracks):
+    """ The saved tracks, then 3 more """
+    return AppendedTracks(saved, make_tracks(3, len(saved)))
+
+
+def test_appended_tracks_indexing(tracks, saved, make_tracks):
+    n = len(saved)
+    expected = make_tracks(n + 3)
+
+    assert len(tracks) == n + 3
+    assert tracks[n - 1].id_ == expected[n - 1].id_ and tracks[n].id_ == expected[n].id_
+    assert tracks[-1].id_ == expected[-1].id_ and tracks[-(n + 3)].id_ == expected[0].id_
+    assert ids(tracks) == ids(expected)
+
+    for i in (n + 3, -(n + 4)):
+        with pytest.raises(IndexError):
+            tracks[i]
+
+
+@pytest.mark.parametrize('start, stop, step', [
+    (None, None, None),
+    (-5, None, None), # across the boundary
+    (-2, None, None), # appended tracks only
+    (0, 4, None), # saved tracks only
+    (-6, -1, None),
+    (5, 2, None), # empty
+    (None, None, 7),
+    (-6, None, 2),
+])
+def test_appended_tracks_slicing(tracks, saved, make_tracks, start, stop, step):
+    expected = make_tracks(len(saved) + 3)
+    assert ids(tracks[start:stop:step]) == ids(expected[start:stop:step])
+
+
+def test_appended_tracks_slice_is_lazy(tracks, saved):
+    # Slices of the saved tracks stay over the file, so nothing is decoded
+    tail = tracks[-5:]
+    assert isinstance(tail, AppendedTracks) and isinstance(tail.saved, TrackColumns)
+    assert len(tail.saved) == 2 and len(tail.appended) == 3
+
+
+def test_appended_tracks_extend(tracks, make_tracks):
+    n = len(tracks)
+    tracks.extend(make_tracks(2, n))
+    assert ids(tracks[n:]) == ids(make_tracks(2, n))